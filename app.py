@@ -1,8 +1,36 @@
-from flask import Flask, render_template, request, jsonify
-from scraper import TVListingsScraper
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from scraper import TVListingsScraper, listings_url, page_validators
+from cache import ListingsCache, MetadataCache, TODAY_KEY, content_hash
+from resilience import UpstreamUnavailableError, upstream_policy
+from rate_limit import upstream_limiter
+from prefetch import PrefetchScheduler
+from listing_store import ListingStore
+from search_index import SearchIndex
+from schedule_state import EMPTY_SCHEDULE, SchedulePublisher, snapshot_of
+from listing_schema import DEFAULT_TIMEZONE, format_time, listing_normalizer
+from listing_index import parse_query_time
+from listing_diff import diff_listings
+from changes import ChangeLog, PersistedChanges
+import metrics
+from snapshot_store import SnapshotStore
+from shared_cache import LeaderLease, SharedCacheCoordinator, SharedLoads
+from async_scraper import ASYNC_AVAILABLE, AsyncEngine, EngineScraper
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import atexit
+import contextvars
+import gzip
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,14 +38,504 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Global variable to store scraped data
-scraped_data = {
-    'listings': [],
-    'networks': [],
-    'dates': [],
-    'last_scraped': None,
-    'is_scraping': False
-}
+# Timing spans and counters behind /metrics; near free when disabled
+metrics.registry.enabled = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+@app.before_request
+def begin_request_metrics():
+    """Start timing the request and counting the upstream calls it makes"""
+    if metrics.registry.enabled:
+        g.request_started = time.perf_counter()
+        g.upstream_count = metrics.start_upstream_count()
+
+@app.teardown_request
+def end_request_metrics(error=None):
+    """Record request duration and upstream calls (after any streamed body)"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    endpoint = request.endpoint or 'unknown'
+    metrics.http_request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+    upstream_count = g.pop('upstream_count', None)
+    if upstream_count is not None:
+        metrics.upstream_per_request.observe(upstream_count[0], endpoint=endpoint)
+
+# Parsed listings per date, served stale while refreshing after the TTL
+listings_cache = ListingsCache(
+    ttl=int(os.environ.get('LISTINGS_CACHE_TTL', 900)),
+    max_entries=int(os.environ.get('LISTINGS_CACHE_MAX_ENTRIES', 16))
+)
+
+# Time zone of the site's listing times: listing start timestamps and "now"
+listing_normalizer.timezone = os.environ.get('LISTINGS_TZ', DEFAULT_TIMEZONE)
+
+# Compact history of every date scraped, kept for weeks
+history = ListingStore(max_dates=int(os.environ.get('HISTORY_MAX_DATES', 60)))
+
+# Title search over the history, updated as dates are stored
+search_index = SearchIndex(history)
+
+def record_history(key, listings, metadata):
+    """Add a freshly cached date to the history store"""
+    date_string = metadata.get('current_date', 'Unknown Date')
+    history.add(key if date_string == 'Unknown Date' else date_string, listings)
+
+listings_cache.add_listener(record_history)
+
+# Available dates and networks, cached apart from the listings; refreshed by
+# cheap metadata-only fetches and by every full fetch of today's page
+metadata_cache = MetadataCache(ttl=int(os.environ.get('METADATA_CACHE_TTL', 3600)))
+
+def record_metadata(key, listings, metadata):
+    """Keep the metadata cache current with freshly cached copies of today's page"""
+    if key == TODAY_KEY:
+        metadata_cache.put(metadata)
+
+listings_cache.add_listener(record_metadata)
+
+# Immutable per-date snapshots of the schedule, published as the cache
+# stores new content and read by requests without a lock
+schedule = SchedulePublisher(max_dates=listings_cache.max_entries)
+
+def publish_schedule(key, listings, metadata):
+    """Publish a freshly cached date as its next schedule snapshot"""
+    entry = listings_cache.peek_entry(key)
+    # A newer store of the key publishes itself
+    if entry is not None and entry.listings is listings:
+        schedule.publish(key, entry)
+
+listings_cache.add_listener(publish_schedule)
+
+# Date key of the last /scrape request, reported by /status
+last_requested_key = TODAY_KEY
+
+# Parsed snapshots on disk, so a restart can serve the last good data at once
+SNAPSHOT_DB = os.environ.get('SNAPSHOT_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots.db'))
+SNAPSHOT_WARM_MAX_AGE = int(os.environ.get('SNAPSHOT_WARM_MAX_AGE', 86400))
+snapshots = SnapshotStore(
+    SNAPSHOT_DB,
+    retain_days=float(os.environ.get('SNAPSHOT_RETAIN_DAYS', 28))
+) if SNAPSHOT_DB else None
+snapshots_loaded = threading.Event()
+snapshots_lock = threading.Lock()
+
+if snapshots:
+    listings_cache.add_listener(snapshots.save)
+    listings_cache.add_touch_listener(snapshots.touch)
+
+# Log of schedule changes between successive scrapes of each date, kept in
+# the snapshot file when there is one (else in memory, lost on restart)
+CHANGE_LOG_SIZE = int(os.environ.get('CHANGE_LOG_SIZE', 1000))
+change_log = ChangeLog(
+    history,
+    max_changes=CHANGE_LOG_SIZE,
+    persisted=PersistedChanges(SNAPSHOT_DB, max_changes=CHANGE_LOG_SIZE) if snapshots else None
+)
+
+def record_changes(key, listings, metadata):
+    """Diff a freshly cached date's history block against its previous one"""
+    date_string = metadata.get('current_date', 'Unknown Date')
+    date = key if date_string == 'Unknown Date' else date_string
+    # record_history, which runs first, has just stored the block
+    block = history.block(date)
+    if block is None:
+        return
+    entry = listings_cache.peek_entry(key)
+    change = change_log.observe(date, block, entry.version if entry else None, entry.digest if entry else None)
+    if change:
+        logger.info(f"Schedule change for {change['date']}: "
+                    f"{len(change['added'])} added, {len(change['removed'])} removed")
+
+listings_cache.add_listener(record_changes)
+
+# Each upstream page fetch gets a latency budget for its retries and hedges;
+# a run of failures opens the circuit breaker for a while
+upstream_policy.budget = float(os.environ.get('UPSTREAM_BUDGET', 10))
+upstream_policy.attempt_timeout = float(os.environ.get('UPSTREAM_ATTEMPT_TIMEOUT', 8))
+upstream_policy.retries = int(os.environ.get('UPSTREAM_RETRIES', 2))
+upstream_policy.hedge = os.environ.get('UPSTREAM_HEDGE', '1') == '1'
+upstream_policy.breaker.failure_threshold = int(os.environ.get('BREAKER_FAILURES', 5))
+upstream_policy.breaker.reset_timeout = float(os.environ.get('BREAKER_RESET', 30))
+
+# Every upstream attempt takes a token from a bucket refilled at UPSTREAM_RATE
+# per second, and at most UPSTREAM_MAX_CONCURRENCY pages download at once.
+# The bucket lives in the snapshot file so all workers share one rate.
+upstream_limiter.rate = float(os.environ.get('UPSTREAM_RATE', 5))
+upstream_limiter.burst = int(os.environ.get('UPSTREAM_BURST', 10))
+upstream_limiter.max_concurrency = int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', 8))
+upstream_limiter.fail_fast = os.environ.get('UPSTREAM_RATE_FAIL_FAST', '0') == '1'
+if SNAPSHOT_DB and os.environ.get('UPSTREAM_RATE_SHARED', '1') == '1':
+    upstream_limiter.shared_path = SNAPSHOT_DB
+
+# Longest a request waits on upstream before falling back to the last good data
+REQUEST_BUDGET = float(os.environ.get('REQUEST_BUDGET', 5))
+
+# Upstream pages are fetched on one event loop (aiohttp) and parsed off it.
+# Only the fetches are async: the views stay synchronous, and a request
+# thread still blocks until its scrape finishes (or REQUEST_BUDGET runs out)
+ASYNC_SCRAPER = ASYNC_AVAILABLE and os.environ.get('ASYNC_SCRAPER', '1') == '1'
+# Parse pages chunk by chunk while they download instead of buffering them
+STREAM_PARSE = os.environ.get('STREAM_PARSE', '1') == '1'
+scrape_engine = AsyncEngine(
+    max_concurrency=int(os.environ.get('SCRAPE_CONCURRENCY', 8)),
+    stream=STREAM_PARSE
+) if ASYNC_SCRAPER else None
+
+if scrape_engine:
+    atexit.register(scrape_engine.close)
+
+def make_scraper():
+    """Scraper used by the cache loaders: the async engine when available"""
+    return EngineScraper(scrape_engine) if scrape_engine else TVListingsScraper(stream=STREAM_PARSE)
+
+# Keeps every upstream date warm so requests rarely wait on a live scrape
+prefetcher = PrefetchScheduler(
+    listings_cache,
+    interval=int(os.environ.get('PREFETCH_INTERVAL', 600)),
+    jitter=float(os.environ.get('PREFETCH_JITTER', 0.1)),
+    scraper_factory=make_scraper
+)
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', '1') == '1'
+
+# With several web workers (gunicorn -w N) the snapshot file doubles as a
+# shared cache: one leader worker scrapes, the others read its snapshots
+SHARED_CACHE = bool(snapshots) and os.environ.get('SHARED_CACHE', '1') == '1'
+coordinator = SharedCacheCoordinator(
+    listings_cache,
+    snapshots,
+    prefetcher if PREFETCH_ENABLED else None,
+    LeaderLease(SNAPSHOT_DB, ttl=float(os.environ.get('LEADER_LEASE_TTL', 30))),
+    poll_interval=float(os.environ.get('SHARED_POLL_INTERVAL', 5))
+) if SHARED_CACHE else None
+
+# On a miss, wait this long for a worker already scraping the date
+SHARED_LOAD_WAIT = float(os.environ.get('SHARED_LOAD_WAIT', 5))
+shared_loads = SharedLoads(snapshots, SNAPSHOT_DB, wait=SHARED_LOAD_WAIT) if coordinator else None
+
+if coordinator:
+    listings_cache.shared = shared_loads
+    atexit.register(coordinator.stop)
+
+# Page size limits for /listings
+LISTINGS_DEFAULT_LIMIT = 100
+LISTINGS_MAX_LIMIT = 1000
+
+# JSON responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = 1024
+
+# Upper bound on dates fetched in parallel by /scrape-all
+SCRAPE_WORKERS = int(os.environ.get('SCRAPE_WORKERS', 4))
+
+@app.before_request
+def load_snapshots():
+    """
+    Warm the cache and history from disk on the first request
+    
+    Recent snapshots go into the cache marked stale, so they are served at
+    once and refreshed in the background; older days only go into history.
+    """
+    if not snapshots or snapshots_loaded.is_set():
+        return
+    with snapshots_lock:
+        if snapshots_loaded.is_set():
+            return
+        try:
+            snapshots.compact()
+            now = time.time()
+            loaded = 0
+            for snapshot in snapshots.latest_all():
+                if now - snapshot['scraped_at_epoch'] <= SNAPSHOT_WARM_MAX_AGE:
+                    listings_cache.put(snapshot['date_key'], snapshot['listings'], snapshot['metadata'], stale=True,
+                                       scraped_at=snapshot['scraped_at_epoch'])
+                    loaded += 1
+                else:
+                    record_history(snapshot['date_key'], snapshot['listings'], snapshot['metadata'])
+            logger.info(f"Loaded {loaded} recent snapshots from {SNAPSHOT_DB}")
+        except Exception as e:
+            logger.error(f"Could not load snapshots: {e}")
+        finally:
+            snapshots_loaded.set()
+
+@app.before_request
+def start_prefetch():
+    """Start prefetching (or leader election) in the process that serves requests"""
+    if coordinator:
+        coordinator.start()
+    elif PREFETCH_ENABLED:
+        prefetcher.start()
+
+def cached_all_dates(lookup=None, partial=False):
+    """
+    Build scrape_all_dates-shaped data from the cache
+    
+    Args:
+        lookup: Function returning the entry for a key, or None if there is
+            none (default: listings_cache.peek_entry)
+        partial: Skip dates without an entry instead of giving up
+    
+    Returns:
+        Tuple of (all_dates_data, metadata, entries), or None if any date is
+        not cached; entries maps each date to its cache entry
+    """
+    lookup = lookup or listings_cache.peek_entry
+    today = lookup(TODAY_KEY)
+    if not today:
+        return None
+    
+    metadata = today.metadata
+    all_dates_data = {}
+    entries = {}
+    for date_string in metadata.get('dates', []):
+        entry = lookup(date_string)
+        if not entry:
+            if partial:
+                continue
+            return None
+        entries[date_string] = entry
+        all_dates_data[date_string] = (entry.listings, entry.metadata.get('current_date', date_string))
+    
+    return (all_dates_data, metadata, entries) if all_dates_data else None
+
+def last_good(key):
+    """
+    The last good result for a cache key, wherever it is still held
+    
+    Looks in the cache (even past its TTL), then the parsed pages kept with
+    the upstream validators, then the snapshot store. Results found outside
+    the cache are put back into it, marked stale so they get refreshed.
+    
+    Returns:
+        CacheEntry, or None if the key was never scraped successfully
+    """
+    entry = listings_cache.peek_entry(key)
+    if entry and entry.listings:
+        return entry
+    
+    page = page_validators.get(listings_url(None if key == TODAY_KEY else key))
+    if page:
+        listings, metadata = page['result']
+        scraped_at = page['fetched_at']
+    elif snapshots:
+        snapshot = snapshots.latest(key)
+        if not snapshot:
+            return None
+        listings, metadata, scraped_at = snapshot['listings'], snapshot['metadata'], snapshot['scraped_at_epoch']
+    else:
+        return None
+    return listings_cache.put(key, listings, metadata, stale=True, scraped_at=scraped_at)
+
+def load_entry(key, loader, deadline=None):
+    """
+    Get a date through the cache within the request's latency budget
+    
+    If upstream fails, is cut off by the circuit breaker or does not answer
+    before the deadline, the last good data is returned instead (the load
+    carries on in the background and fills the cache when it completes).
+    An entry past its TTL is always reported stale, since it is served
+    while a background refresh runs.
+    
+    Args:
+        key: Cache key of the date
+        loader: Callable scraping the date
+        deadline: time.monotonic() value to give up at (default: REQUEST_BUDGET from now)
+        
+    Returns:
+        Tuple of (entry, stale_reason) where stale_reason is None for
+        current data, or why older data is being served
+        
+    Raises:
+        UpstreamUnavailableError: If upstream failed or the budget ran out
+            and there is no earlier data
+    """
+    deadline = deadline or time.monotonic() + REQUEST_BUDGET
+    try:
+        entry = listings_cache.get_entry(key, loader, timeout=max(0.0, deadline - time.monotonic()))
+        if entry.listings:
+            if time.monotonic() - entry.stored_at < listings_cache.ttl:
+                return entry, None
+            return entry, 'upstream circuit open' if upstream_policy.breaker.is_open else 'refreshing expired data'
+        reason = 'upstream circuit open' if upstream_policy.breaker.is_open else 'upstream request failed'
+    except TimeoutError:
+        entry = None
+        reason = 'latency budget exceeded'
+    
+    fallback = last_good(key)
+    if fallback is not None:
+        logger.warning(f"Serving last good data for {key}: {reason}")
+        return fallback, reason
+    if entry is None:
+        raise UpstreamUnavailableError(
+            f"Upstream did not answer within {REQUEST_BUDGET}s and no earlier data is available"
+        )
+    if not entry.metadata:
+        # A failed scrape parses nothing; a page that parsed is just empty
+        raise UpstreamUnavailableError(f"Upstream unavailable ({reason}) and no earlier data is available")
+    return entry, None
+
+def as_of(scraped_at):
+    """When served data was scraped, for a stale response"""
+    return datetime.fromtimestamp(scraped_at).isoformat()
+
+def load_date(date_param):
+    """
+    Load the listings for a date parameter through the cache
+    
+    Args:
+        date_param: Date index into the available dates, date string, or '' for today
+        
+    Returns:
+        Tuple of (entry, base_metadata, key, stale_reason) where entry is the
+        cache entry for the date, base_metadata is the site metadata (the
+        networks and available dates), key is the date's cache key and
+        stale_reason is None unless last good data is served in its place
+    """
+    scraper = make_scraper()
+    deadline = time.monotonic() + REQUEST_BUDGET
+    
+    # Determine which date to scrape
+    date_string = None
+    if date_param.isdigit():
+        # It's an index into the available dates (0 is today)
+        date_index = int(date_param)
+        if date_index > 0:
+            available_dates = load_metadata(scraper, deadline).get('dates', [])
+            if date_index < len(available_dates):
+                date_string = available_dates[date_index]
+    elif date_param:
+        # It's a date string
+        date_string = date_param
+    
+    if date_string:
+        entry, stale = load_entry(
+            date_string, lambda: scraper.scrape_by_date(date_string=date_string), deadline
+        )
+        try:
+            metadata = load_metadata(scraper, deadline)
+        except (TimeoutError, UpstreamUnavailableError):
+            # The listings are here; don't fail them for the date list
+            metadata = known_metadata(entry)
+        return entry, metadata, date_string, stale
+    
+    # No date specified (or today's index), use the default page
+    base_entry, stale = load_entry(TODAY_KEY, scraper.scrape_daily_schedule, deadline)
+    return base_entry, base_entry.metadata, TODAY_KEY, stale
+
+def load_metadata(scraper, deadline=None):
+    """
+    Site metadata (available dates, networks), without loading listings if possible
+    
+    Reads the metadata cache, which loads with a metadata-only fetch on a
+    miss; falls back to today's full page if that fails.
+    
+    Args:
+        scraper: Scraper to load with
+        deadline: time.monotonic() value to give up at (default: REQUEST_BUDGET from now)
+    """
+    deadline = deadline or time.monotonic() + REQUEST_BUDGET
+    try:
+        metadata = metadata_cache.get(scraper.scrape_metadata, timeout=max(0.0, deadline - time.monotonic()))
+    except TimeoutError:
+        metadata = None
+    if metadata and metadata.get('dates'):
+        return metadata
+    entry, _ = load_entry(TODAY_KEY, scraper.scrape_daily_schedule, deadline)
+    return entry.metadata
+
+def known_metadata(entry=None):
+    """
+    The last site metadata seen, without asking upstream
+    
+    Tries the metadata cache (even expired), then today's last good page,
+    then the metadata of the given date's own page.
+    """
+    metadata = metadata_cache.peek()
+    if metadata and metadata.get('dates'):
+        return metadata
+    today = last_good(TODAY_KEY)
+    if today is not None and today.metadata.get('dates'):
+        return today.metadata
+    return entry.metadata if entry is not None else {}
+
+def combined_etag(*parts):
+    """Strong ETag value for a response built from the given snapshot digests"""
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:24]
+
+def versioned_json(payload, etag):
+    """
+    jsonify a payload with a strong ETag, or answer 304 if the client has it
+    
+    The client may hold the tag with a content-coding suffix added by
+    compress_response, so those variants match too.
+    """
+    for tag in (etag, f'{etag}-gzip', f'{etag}-br'):
+        if tag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+    
+    with metrics.span('jsonify'):
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Brotli- or gzip-compress JSON responses the client accepts compressed"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+    
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    with metrics.span('compress'):
+        if brotli and request.accept_encodings['br']:
+            encoding, data = 'br', brotli.compress(data, quality=5)
+        elif request.accept_encodings['gzip']:
+            encoding, data = 'gzip', gzip.compress(data, compresslevel=6)
+        else:
+            return response
+    
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+def scrape_all_into_cache():
+    """
+    Scrape every date (one upstream request each) and cache the results
+    
+    Returns:
+        Tuple of (all_dates_data, metadata, report)
+    """
+    scraper = make_scraper()
+    results, metadata, report = scraper.scrape_all_dates_detailed(max_workers=SCRAPE_WORKERS)
+    
+    all_dates_data = {}
+    for date_string, (listings, date_metadata) in results.items():
+        listings_cache.put(date_string, listings, date_metadata)
+        if date_string == metadata['dates'][0]:
+            listings_cache.put(TODAY_KEY, listings, date_metadata)
+        all_dates_data[date_string] = (listings, date_metadata.get('current_date', date_string))
+    
+    return all_dates_data, metadata, report
+
+@app.after_request
+def add_snapshot_version(response):
+    """Tell the client which published schedule snapshot the response was built from"""
+    version = g.get('snapshot_version')
+    if version is not None:
+        response.headers['X-Snapshot-Version'] = str(version)
+    return response
+
+# Flight key for a full all-dates scrape
+ALL_DATES_KEY = '*all*'
 
 @app.route('/')
 def index():
@@ -27,39 +545,15 @@ def index():
 @app.route('/scrape')
 def scrape():
     """Endpoint to scrape TV listings"""
-    global scraped_data
-    
-    if scraped_data['is_scraping']:
-        return jsonify({'success': False, 'message': 'Scraping already in progress'})
-    
-    scraped_data['is_scraping'] = True
-    
+    global last_requested_key
     try:
-        scraper = TVListingsScraper()
-        
         # Get date parameter
         date_param = request.args.get('date', '')
         
-        # First, get available dates
-        _, base_metadata = scraper.scrape_daily_schedule()
+        entry, base_metadata, key, stale = load_date(date_param)
         available_dates = base_metadata.get('dates', [])
         
-        # Determine which date to scrape
-        if date_param.isdigit():
-            # It's an index
-            date_index = int(date_param)
-            if 0 <= date_index < len(available_dates):
-                listings, metadata = scraper.scrape_by_date(date_index=date_index)
-            else:
-                listings, metadata = scraper.scrape_daily_schedule()
-        elif date_param:
-            # It's a date string
-            listings, metadata = scraper.scrape_by_date(date_string=date_param)
-        else:
-            # No date specified, get current
-            listings, metadata = scraper.scrape_daily_schedule()
-        
-        if not listings:
+        if not entry.listings:
             return jsonify({
                 'success': False,
                 'error': 'No listings found for the selected date.',
@@ -68,21 +562,53 @@ def scrape():
                 'dates': available_dates
             })
         
-        # Update global data
-        scraped_data['listings'] = listings
-        scraped_data['networks'] = metadata.get('networks', [])
-        scraped_data['dates'] = available_dates
-        scraped_data['last_scraped'] = datetime.now().isoformat()
+        # Answer from the date's published snapshot. Only the cache listener
+        # publishes; if it has not caught up with this entry (or the date was
+        # trimmed), the entry is read as a snapshot without publishing it
+        snapshot = schedule.get(key)
+        if snapshot is None or snapshot.version < entry.version:
+            snapshot = snapshot_of(key, entry)
+        last_requested_key = key
+        listings = snapshot.listings
+        g.snapshot_version = snapshot.version
         
-        return jsonify({
+        payload = {
             'success': True,
             'listings': listings,
-            'networks': scraped_data['networks'],
-            'dates': scraped_data['dates'],
-            'current_date': metadata.get('current_date', 'Unknown'),
-            'total': len(listings)
-        })
+            'networks': snapshot.networks,
+            'dates': available_dates,
+            'current_date': snapshot.current_date or 'Unknown',
+            'total': len(listings),
+            'version': snapshot.version,
+            'stale': stale is not None
+        }
+        if stale:
+            payload['stale_reason'] = stale
+            payload['as_of'] = snapshot.scraped_at
+        etag = combined_etag(snapshot.digest, str(snapshot.version), content_hash([], base_metadata))
+        
+        # With ?since=<version>, send only what changed since that version
+        since = request.args.get('since', '')
+        if since.isdigit():
+            previous = listings if int(since) == snapshot.version else listings_cache.previous_listings(key, int(since))
+            if previous is not None:
+                del payload['listings']
+                payload.update(diff_listings(previous, listings))
+                payload['delta'] = True
+                payload['since'] = int(since)
+                etag = combined_etag(etag, since)
+        
+        return versioned_json(payload, etag)
     
+    except UpstreamUnavailableError as e:
+        logger.error(f"Scraping error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'listings': [],
+            'networks': [],
+            'dates': []
+        }), 503
     except Exception as e:
         logger.error(f"Scraping error: {e}")
         return jsonify({
@@ -92,52 +618,66 @@ def scrape():
             'networks': [],
             'dates': []
         })
-    
-    finally:
-        scraped_data['is_scraping'] = False
 
 @app.route('/scrape-all')
 def scrape_all():
     """Endpoint to scrape all available dates"""
-    global scraped_data
-    
-    if scraped_data['is_scraping']:
-        return jsonify({'success': False, 'message': 'Scraping already in progress'})
-    
-    scraped_data['is_scraping'] = True
-    
     try:
-        scraper = TVListingsScraper()
-        
-        # Scrape all dates
-        all_dates_data = scraper.scrape_all_dates()
+        # Serve from the prefetched cache when every date is warm
+        cached = cached_all_dates()
+        if not cached and coordinator:
+            # Another worker may already have scraped the missing dates
+            coordinator.sync()
+            cached = cached_all_dates()
+        report = None
+        entries = {}
+        stale = None
+        if cached:
+            all_dates_data, metadata, entries = cached
+        else:
+            try:
+                # Concurrent cold requests share one full scrape
+                all_dates_data, metadata, report = listings_cache.flight.do(
+                    ALL_DATES_KEY, scrape_all_into_cache, timeout=REQUEST_BUDGET
+                )
+            except TimeoutError:
+                # Serve whatever earlier data exists; the scrape carries on
+                stale = 'latency budget exceeded'
+                all_dates_data, metadata, entries = cached_all_dates(last_good, partial=True) or ({}, {}, {})
         
         if not all_dates_data:
             return jsonify({
                 'success': False,
                 'error': 'No data found for any dates.',
-                'data': {}
+                'data': {},
+                'report': report
             })
         
         # Combine all listings
         all_listings = []
         for date_string, (listings, actual_date) in all_dates_data.items():
-            # Add date to each listing
-            for listing in listings:
-                listing['date'] = actual_date
-            all_listings.extend(listings)
-        
-        # Get metadata from first successful scrape
-        _, metadata = scraper.scrape_daily_schedule()
+            # Add date to each listing (copies, the originals may be cached)
+            all_listings.extend(dict(listing, date=actual_date) for listing in listings)
         
-        return jsonify({
+        payload = {
             'success': True,
             'data': all_dates_data,
             'all_listings': all_listings,
             'total_listings': len(all_listings),
             'dates_scraped': list(all_dates_data.keys()),
-            'networks': metadata.get('networks', [])
-        })
+            'networks': metadata.get('networks', []),
+            'report': report,
+            'stale': stale is not None
+        }
+        if stale:
+            payload['stale_reason'] = stale
+            if entries:
+                payload['as_of'] = as_of(min(entry.scraped_at for entry in entries.values()))
+        if not entries:
+            return jsonify(payload)
+        
+        payload['versions'] = {date_string: entry.version for date_string, entry in entries.items()}
+        return versioned_json(payload, combined_etag(*(entry.digest for entry in entries.values())))
     
     except Exception as e:
         logger.error(f"Scraping error: {e}")
@@ -146,18 +686,472 @@ def scrape_all():
             'error': str(e),
             'data': {}
         })
+
+@app.route('/scrape-all/stream')
+def scrape_all_stream():
+    """
+    Stream all available dates as NDJSON
+    
+    Emits one {"type": "date", ...} record per date as soon as it is loaded
+    (today first), then a {"type": "summary", ...} record.
+    """
+    def date_record(date_string, listings, metadata, duration, error=None, stale=None, scraped_at=None):
+        actual_date = metadata.get('current_date', date_string)
+        record = {
+            'type': 'date',
+            'date': date_string,
+            'current_date': actual_date,
+            'listings': [dict(listing, date=actual_date) for listing in listings],
+            'total': len(listings),
+            'duration': duration,
+            'error': error,
+            'stale': stale is not None
+        }
+        if stale:
+            record['stale_reason'] = stale
+            record['as_of'] = as_of(scraped_at)
+        return json.dumps(record) + '\n'
+    
+    def load(date_string):
+        started = time.monotonic()
+        stale = None
+        scraped_at = None
+        try:
+            scraper = make_scraper()
+            entry, stale = load_entry(date_string, lambda: scraper.scrape_by_date(date_string=date_string))
+            listings, metadata, scraped_at = entry.listings, entry.metadata, entry.scraped_at
+            error = None if listings else 'No listings found'
+        except Exception as e:
+            listings, metadata, error = [], {}, str(e)
+        return date_string, listings, metadata, round(time.monotonic() - started, 3), error, stale, scraped_at
+    
+    def generate():
+        started = time.monotonic()
+        dates_scraped = []
+        total_listings = 0
+        
+        today_stale = None
+        try:
+            today, today_stale = load_entry(TODAY_KEY, make_scraper().scrape_daily_schedule)
+            today_listings, metadata = today.listings, today.metadata
+        except Exception as e:
+            logger.error(f"Scraping error: {e}")
+            today_listings, metadata = [], {}
+        available_dates = metadata.get('dates', [])
+        
+        if today_listings and available_dates:
+            dates_scraped.append(available_dates[0])
+            total_listings += len(today_listings)
+            yield date_record(available_dates[0], today_listings, metadata, round(time.monotonic() - started, 3),
+                              stale=today_stale, scraped_at=today.scraped_at)
+        
+        remaining = available_dates[1:]
+        if remaining:
+            with ThreadPoolExecutor(max_workers=SCRAPE_WORKERS) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, load, date_string)
+                           for date_string in remaining]
+                for future in as_completed(futures):
+                    date_string, listings, date_metadata, duration, error, stale, scraped_at = future.result()
+                    if listings:
+                        dates_scraped.append(date_string)
+                        total_listings += len(listings)
+                    yield date_record(date_string, listings, date_metadata, duration, error, stale, scraped_at)
+        
+        yield json.dumps({
+            'type': 'summary',
+            'success': bool(dates_scraped),
+            'error': None if dates_scraped else 'No data found for any dates.',
+            'dates_scraped': [date_string for date_string in available_dates if date_string in dates_scraped],
+            'total_listings': total_listings,
+            'networks': metadata.get('networks', []),
+            'duration': round(time.monotonic() - started, 3)
+        }) + '\n'
     
-    finally:
-        scraped_data['is_scraping'] = False
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def parse_flag(value):
+    """Boolean query parameter ('1'/'true'/'yes' or '0'/'false'/'no'), None if absent"""
+    if value is None or value == '':
+        return None
+    value = value.lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Invalid flag {value!r}")
+
+@app.route('/dates')
+def dates():
+    """Available dates and networks (for the date picker), without the listings"""
+    try:
+        metadata = load_metadata(make_scraper())
+    except Exception as e:
+        logger.error(f"Metadata error: {e}")
+        metadata = {}
+    
+    if not metadata.get('dates'):
+        return jsonify({
+            'success': False,
+            'error': 'Could not read the available dates.',
+            'dates': [],
+            'networks': []
+        })
+    
+    return versioned_json({
+        'success': True,
+        'dates': metadata['dates'],
+        'networks': metadata.get('networks', []),
+        'current_date': metadata.get('current_date', 'Unknown')
+    }, combined_etag(content_hash([], metadata)))
+
+@app.route('/listings')
+def query_listings():
+    """
+    Indexed listing query
+    
+    Query parameters: date (index or date string, default today), network
+    (comma separated), start/end (e.g. "8 PM" or "20:00"; a window may wrap
+    past midnight), movie (true/false), offset and limit.
+    """
+    try:
+        network_param = request.args.get('network', '')
+        start_param = request.args.get('start', '')
+        end_param = request.args.get('end', '')
+        start = parse_query_time(start_param) if start_param else None
+        end = parse_query_time(end_param) if end_param else None
+        movie = parse_flag(request.args.get('movie'))
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(LISTINGS_MAX_LIMIT, max(1, int(request.args.get('limit', LISTINGS_DEFAULT_LIMIT))))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'listings': []})
+    
+    try:
+        entry, _, _, stale = load_date(request.args.get('date', ''))
+        listings, metadata = entry.listings, entry.metadata
+    except UpstreamUnavailableError as e:
+        logger.error(f"Scraping error: {e}")
+        return jsonify({'success': False, 'error': str(e), 'listings': []}), 503
+    except Exception as e:
+        logger.error(f"Scraping error: {e}")
+        return jsonify({'success': False, 'error': str(e), 'listings': []})
+    
+    if not listings:
+        return jsonify({
+            'success': False,
+            'error': 'No listings found for the selected date.',
+            'listings': []
+        })
+    
+    history_key, block = history_block(listings, metadata)
+    
+    started = time.perf_counter()
+    network_ids = history.network_ids(network_param.split(',')) if network_param else None
+    rows = block.index.query(network_ids=network_ids, start=start, end=end, movie=movie)
+    page = list(history.rows(block, rows[offset:offset + limit]))
+    query_ms = round((time.perf_counter() - started) * 1000, 3)
+    
+    payload = {
+        'success': True,
+        'listings': page,
+        'current_date': history_key,
+        'total': len(rows),
+        'offset': offset,
+        'limit': limit,
+        'version': entry.version,
+        'stale': stale is not None,
+        'query_ms': query_ms
+    }
+    if stale:
+        payload['stale_reason'] = stale
+        payload['as_of'] = as_of(entry.scraped_at)
+    return versioned_json(payload, combined_etag(entry.digest, request.query_string.decode('utf-8', 'replace')))
+
+def history_block(listings, metadata):
+    """
+    The indexed history block for a date's listings
+    
+    Returns:
+        Tuple of (date header, DateBlock)
+    """
+    # Cached dates are normally in the history store already
+    history_key = metadata.get('current_date', 'Unknown Date')
+    block = history.block(history_key)
+    if block is None:
+        history.add(history_key, listings)
+        block = history.block(history_key)
+    return history_key, block
+
+def following_block(base_metadata, key):
+    """
+    The cached date after ``key``, without scraping it
+    
+    Returns:
+        Tuple of (cache entry, DateBlock), or (None, None) if that date is
+        not cached
+    """
+    available_dates = base_metadata.get('dates', [])
+    position = 0 if key == TODAY_KEY else (available_dates.index(key) if key in available_dates else -1)
+    if position < 0 or position + 1 >= len(available_dates):
+        return None, None
+    entry = listings_cache.peek_entry(available_dates[position + 1])
+    if entry is None or not entry.listings:
+        return None, None
+    return entry, history_block(entry.listings, entry.metadata)[1]
+
+def slot_listing(block, slot):
+    """Listing dict for an interval index slot, with its derived end time"""
+    row, _, end = slot
+    listing = next(history.rows(block, [row]))
+    listing['end_time'] = format_time(end) if end is not None else None
+    return listing
+
+def on_air_response(upcoming):
+    """
+    Shared body of /now and /next
+    
+    Query parameters: network (comma separated, default every network),
+    date (index or date string, default today) and time (default the
+    current time in LISTINGS_TZ).
+    """
+    try:
+        time_param = request.args.get('time', '')
+        if time_param:
+            minute = parse_query_time(time_param)
+        else:
+            now = listing_normalizer.now()
+            minute = now.hour * 60 + now.minute
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'listings': []})
+    
+    try:
+        entry, base_metadata, key, stale = load_date(request.args.get('date', ''))
+        listings, metadata = entry.listings, entry.metadata
+    except UpstreamUnavailableError as e:
+        logger.error(f"Scraping error: {e}")
+        return jsonify({'success': False, 'error': str(e), 'listings': []}), 503
+    except Exception as e:
+        logger.error(f"Scraping error: {e}")
+        return jsonify({'success': False, 'error': str(e), 'listings': []})
+    
+    if not listings:
+        return jsonify({
+            'success': False,
+            'error': 'No listings found for the selected date.',
+            'listings': []
+        })
+    
+    history_key, block = history_block(listings, metadata)
+    network_param = request.args.get('network', '')
+    if network_param:
+        network_ids = history.network_ids(network_param.split(','))
+        if not network_ids:
+            return jsonify({'success': False, 'error': f"Unknown network {network_param!r}", 'listings': []})
+    else:
+        network_ids = list(block.index.slots)
+    
+    started = time.perf_counter()
+    found = []
+    digests = [entry.digest]
+    next_entry = next_block = None
+    for network_id in network_ids:
+        if not upcoming:
+            slot = block.index.on_air(network_id, minute)
+            if slot is not None:
+                found.append((0, slot[1], slot_listing(block, slot)))
+            continue
+        
+        slot = block.index.upcoming(network_id, minute)
+        if slot is not None:
+            found.append((0, slot[1], slot_listing(block, slot)))
+            continue
+        # Nothing more on this date: the first slot of the next one, if cached
+        if next_entry is None:
+            next_entry, next_block = following_block(base_metadata, key)
+            if next_entry is None:
+                next_entry = False
+            else:
+                digests.append(next_entry.digest)
+        slot = next_block.index.upcoming(network_id, -1) if next_block else None
+        if slot is not None:
+            found.append((1, slot[1], slot_listing(next_block, slot)))
+    # Soonest first; the next date's slots after this date's
+    found.sort(key=lambda item: (item[0], item[1], item[2]['network']))
+    query_ms = round((time.perf_counter() - started) * 1000, 3)
+    
+    payload = {
+        'success': True,
+        'listings': [listing for _, _, listing in found],
+        'time': format_time(minute % (24 * 60)),
+        'current_date': history_key,
+        'total': len(found),
+        'version': entry.version,
+        'stale': stale is not None,
+        'query_ms': query_ms
+    }
+    if stale:
+        payload['stale_reason'] = stale
+        payload['as_of'] = as_of(entry.scraped_at)
+    return versioned_json(payload, combined_etag(*digests, str(minute), request.query_string.decode('utf-8', 'replace')))
+
+@app.route('/now')
+def now_on_air():
+    """What each network (or the given ones) is showing now, with end times"""
+    return on_air_response(upcoming=False)
+
+@app.route('/next')
+def next_on_air():
+    """What each network (or the given ones) shows next, with end times"""
+    return on_air_response(upcoming=True)
+
+@app.route('/search')
+def search():
+    """
+    Ranked title search over the retained history
+    
+    Query parameters: q (words to find; prefixes and small typos match),
+    date (comma separated date strings or indexes into the available dates,
+    default every retained date), network (comma separated), start/end,
+    movie, offset and limit as for /listings. Never scrapes.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'Missing search query (q).', 'listings': []})
+    
+    try:
+        start_param = request.args.get('start', '')
+        end_param = request.args.get('end', '')
+        start = parse_query_time(start_param) if start_param else None
+        end = parse_query_time(end_param) if end_param else None
+        movie = parse_flag(request.args.get('movie'))
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(LISTINGS_MAX_LIMIT, max(1, int(request.args.get('limit', LISTINGS_DEFAULT_LIMIT))))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'listings': []})
+    
+    dates = None
+    date_param = request.args.get('date', '')
+    if date_param:
+        values = [value.strip() for value in date_param.split(',') if value.strip()]
+        available_dates = []
+        if any(value.isdigit() for value in values):
+            try:
+                available_dates = load_metadata(make_scraper()).get('dates', [])
+            except Exception as e:
+                logger.error(f"Metadata error: {e}")
+        dates = [available_dates[int(value)] if value.isdigit() and int(value) < len(available_dates) else value
+                 for value in values]
+    
+    network_ids = None
+    network_param = request.args.get('network', '')
+    if network_param:
+        network_ids = history.network_ids(network_param.split(','))
+        if not network_ids:
+            return jsonify({'success': False, 'error': f"Unknown network {network_param!r}", 'listings': []})
+    
+    started = time.perf_counter()
+    hits = search_index.search(query, dates=dates, network_ids=network_ids, start=start, end=end,
+                               movie=movie, today=listing_normalizer.now().date())
+    page = []
+    for hit in hits[offset:offset + limit]:
+        listing = next(history.rows(hit.block, [hit.row]))
+        listing['score'] = round(hit.score, 2)
+        page.append(listing)
+    query_ms = round((time.perf_counter() - started) * 1000, 3)
+    
+    return jsonify({
+        'success': True,
+        'listings': page,
+        'query': query,
+        'total': len(hits),
+        'offset': offset,
+        'limit': limit,
+        'query_ms': query_ms
+    })
+
+@app.route('/changes')
+def changes():
+    """
+    Feed of schedule changes
+    
+    Query parameters: since (sequence number of the last change seen),
+    date (only changes for that date string) and limit. Changes are kept in
+    the snapshot file, so they survive restarts; with SNAPSHOT_DB unset they
+    are kept in memory and lost on restart.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(LISTINGS_MAX_LIMIT, max(1, int(request.args.get('limit', LISTINGS_DEFAULT_LIMIT))))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'changes': []})
+    
+    records, has_more = change_log.since(since, date=request.args.get('date') or None, limit=limit)
+    return jsonify({
+        'success': True,
+        'changes': records,
+        'latest': records[-1]['seq'] if records else max(since, change_log.latest_seq()),
+        'has_more': has_more
+    })
+
+@app.route('/history')
+def history_listings():
+    """Listings retained in memory for a past or current date"""
+    date_param = request.args.get('date', '')
+    
+    if not date_param:
+        return jsonify({'success': True, 'dates': history.dates()})
+    
+    listings = history.listings(date_param)
+    if not listings:
+        return jsonify({
+            'success': False,
+            'error': 'No retained listings for that date.',
+            'listings': []
+        })
+    
+    return jsonify({
+        'success': True,
+        'listings': listings,
+        'current_date': date_param,
+        'total': len(listings)
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    if not metrics.registry.enabled:
+        return Response('# metrics disabled (METRICS_ENABLED=0)\n', mimetype='text/plain')
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/status')
 def status():
     """Get current scraping status"""
+    # One read of the last requested date's snapshot (today's until a date is
+    # requested), so every field comes from the same scrape
+    snapshot = schedule.get(last_requested_key) or EMPTY_SCHEDULE
+    g.snapshot_version = snapshot.version
     return jsonify({
-        'is_scraping': scraped_data['is_scraping'],
-        'last_scraped': scraped_data['last_scraped'],
-        'total_listings': len(scraped_data['listings']),
-        'total_networks': len(scraped_data['networks'])
+        'is_scraping': bool(listings_cache.flight.in_flight()),
+        'snapshot_version': snapshot.version,
+        'current_date': snapshot.current_date,
+        'last_scraped': snapshot.scraped_at,
+        'total_listings': len(snapshot.listings),
+        'total_networks': len(snapshot.networks),
+        'cache': listings_cache.stats(),
+        'metadata_cache': metadata_cache.stats(),
+        'prefetch': prefetcher.stats(),
+        'upstream': page_validators.stats(),
+        'async_engine': scrape_engine.stats() if scrape_engine else None,
+        'upstream_policy': upstream_policy.stats(),
+        'rate_limit': upstream_limiter.stats(),
+        'history': history.stats(),
+        'search': search_index.stats(),
+        'changes': change_log.stats(),
+        'snapshots': snapshots.stats() if snapshots else None,
+        'shared': dict(coordinator.stats(), loads=shared_loads.stats()) if coordinator else None
     })
 
 if __name__ == '__main__':
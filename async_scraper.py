@@ -0,0 +1,570 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import count_upstream_request, span
+from page_parser import STREAM_CHUNK_SIZE, DrupalSettingsScanner, ListingsPageStream
+from rate_limit import RateLimitedError, RateLimiter, upstream_limiter
+from resilience import BudgetExceededError, CircuitOpenError, UpstreamPolicy, upstream_policy
+from scraper import TVListingsScraper, PageValidatorStore, page_validators
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+ASYNC_AVAILABLE = aiohttp is not None
+
+ScrapeResult = Tuple[List[Dict[str, str]], Dict]
+
+
+async def _read_body(response) -> bytes:
+    return await response.read()
+
+
+async def _scan_settings(response) -> DrupalSettingsScanner:
+    # Stops reading (and so downloading) once the settings have been seen
+    scanner = DrupalSettingsScanner()
+    with span('settings_scan'):
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if scanner.feed(chunk):
+                break
+    return scanner
+
+
+class ParsePool(Executor):
+    """
+    Parse threads that can keep a page on one thread
+
+    An lxml parser must not move between threads, so a page parsed chunk
+    by chunk runs every step on the single-thread executor ``pin`` hands
+    out. Other work submitted to the pool goes to the threads in turn.
+    """
+
+    def __init__(self, workers: int = 2):
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'parse-{index}')
+            for index in range(max(1, workers))
+        ]
+        self._turn = itertools.count()
+
+    def pin(self) -> ThreadPoolExecutor:
+        """The next parse thread's executor, to run all of one page's steps on"""
+        return self._executors[next(self._turn) % len(self._executors)]
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return self.pin().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, **kwargs):
+        for executor in self._executors:
+            executor.shutdown(wait=wait, **kwargs)
+
+
+class AsyncTVListingsScraper:
+    """
+    asyncio counterpart of TVListingsScraper
+
+    Fetches the same URLs with aiohttp, makes the same conditional requests
+    through the shared PageValidatorStore and returns the same
+    (listings, metadata) results. Decoding and parsing run in a ParsePool,
+    so the event loop only ever waits on sockets; in streaming mode each
+    chunk is parsed there (always on the same thread for a page) while the
+    next one downloads. Fetches follow the same
+    UpstreamPolicy and RateLimiter, and can also be hedged: a slow request
+    is raced against a second one when the rate limiter has a token to spare.
+    """
+
+    def __init__(self, session: 'aiohttp.ClientSession', base_url: str = "https://adp.acb.org",
+                 parser: str = None, validators: Optional[PageValidatorStore] = page_validators,
+                 parse_pool: Optional[ParsePool] = None, max_concurrency: int = 8,
+                 policy: UpstreamPolicy = upstream_policy, stream: bool = True,
+                 limiter: RateLimiter = upstream_limiter):
+        self.session = session
+        # Parsing and URLs are shared with the blocking scraper
+        self.pages = TVListingsScraper(base_url, parser=parser, validators=validators, policy=policy,
+                                       stream=stream, limiter=limiter)
+        self.validators = validators
+        self.policy = policy
+        self.limiter = limiter
+        self.parse_pool = parse_pool or ParsePool()
+        self.max_concurrency = max_concurrency
+        self._limit: Optional[asyncio.Semaphore] = None
+
+    def _limiter(self) -> asyncio.Semaphore:
+        # Created on first use, inside the loop that awaits it
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.max_concurrency)
+        return self._limit
+
+    def _decode_and_parse(self, body: bytes, charset: Optional[str]) -> ScrapeResult:
+        with span('decode'):
+            html_content = body.decode(charset or 'utf-8', errors='replace')
+        return self.pages.parse_page(html_content)
+
+    async def _stream_parse(self, response) -> Tuple[List[Dict[str, str]], Dict, str]:
+        """Reader that parses the body chunk by chunk: (listings, metadata, body hash)"""
+        loop = asyncio.get_running_loop()
+        # The page's parser is created, fed and closed on one thread
+        executor = self.parse_pool.pin()
+        page = await loop.run_in_executor(
+            executor, functools.partial(ListingsPageStream, encoding=response.charset or 'utf-8')
+        )
+        parsing = None
+        with span('stream_parse'):
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                # One chunk is parsed while the next downloads; the parser
+                # must see them in order
+                if parsing:
+                    await parsing
+                parsing = loop.run_in_executor(executor, page.feed, chunk)
+            if parsing:
+                await parsing
+            return await loop.run_in_executor(executor, self.pages.finish_stream, page)
+
+    async def _request(self, url: str, headers: Dict[str, str], previous: Optional[Dict],
+                       reader: Callable = _read_body) -> Tuple:
+        """
+        One upstream request: (body or None for a usable 304, charset, etag, last_modified)
+
+        ``reader`` consumes the response and returns what is reported as the body.
+        """
+        async with self._limiter():
+            started = time.monotonic()
+            try:
+                with span('upstream_fetch'):
+                    async with self.session.get(url, headers=headers) as response:
+                        count_upstream_request(response.status)
+                        body = None
+                        if not (response.status == 304 and previous):
+                            response.raise_for_status()
+                            body = await reader(response)
+                        result = (body, response.charset, response.headers.get('ETag'),
+                                  response.headers.get('Last-Modified'))
+            except aiohttp.ClientResponseError as e:
+                if e.status >= 500:
+                    self.policy.record_failure()
+                else:
+                    self.policy.breaker.record_success()
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                count_upstream_request('error')
+                self.policy.record_failure()
+                raise
+            self.policy.record_success(time.monotonic() - started)
+            return result
+
+    async def _timed_request(self, url: str, headers: Dict[str, str], previous: Optional[Dict],
+                             timeout: float, reader: Callable) -> Tuple:
+        """_request, abandoned (and counted as a failure) after ``timeout`` seconds"""
+        task = asyncio.ensure_future(self._request(url, headers, previous, reader))
+        try:
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if not done:
+                count_upstream_request('timeout')
+                self.policy.record_failure()
+                raise asyncio.TimeoutError(f"No response from {url} within {timeout:.1f}s")
+            return task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def _attempt(self, url: str, headers: Dict[str, str], previous: Optional[Dict], timeout: float,
+                       reader: Callable) -> Tuple:
+        """One request, hedged with a second if it outlasts the recent p95 latency"""
+        hedge_after = self.policy.hedge_delay()
+        if hedge_after is None or hedge_after >= timeout:
+            return await self._timed_request(url, headers, previous, timeout, reader)
+
+        deadline = time.monotonic() + timeout
+        first = asyncio.ensure_future(self._timed_request(url, headers, previous, timeout, reader))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+
+        # A hedge is an extra request, so only send it if a host slot and a
+        # token are free now; it holds its own slot until both have finished
+        async with AsyncExitStack() as hedge_slot:
+            try:
+                await hedge_slot.enter_async_context(self.limiter.slot_async(url, fail_fast=True))
+                await self.limiter.wait_turn_async(url, fail_fast=True)
+            except RateLimitedError:
+                await hedge_slot.aclose()
+                return await first
+            self.policy.count('hedges')
+            hedged = asyncio.ensure_future(
+                self._timed_request(url, headers, previous, max(0.001, deadline - time.monotonic()), reader)
+            )
+            pending = {first, hedged}
+            try:
+                while True:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is hedged:
+                                self.policy.count('hedge_wins')
+                            return task.result()
+                        error = task.exception()
+                    if not pending:
+                        raise error
+            finally:
+                for task in pending:
+                    task.cancel()
+                # The slot is free only once the losing request has stopped
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _fetch(self, url: str, headers: Dict[str, str], previous: Optional[Dict],
+                     reader: Callable = _read_body, deadline: float = None) -> Tuple:
+        """Attempts with jittered backoff within the policy's latency budget, each after a rate limiter token"""
+        policy = self.policy
+        deadline = deadline or policy.deadline()
+        attempt = 0
+        while True:
+            await self.limiter.wait_turn_async(url, deadline)
+            policy.breaker.before_call()
+            timeout = policy.attempt_timeout_for(deadline)
+            try:
+                return await self._attempt(url, headers, previous, timeout, reader)
+            except aiohttp.ClientResponseError as e:
+                if e.status < 500:
+                    raise
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            attempt += 1
+            delay = policy.backoff(attempt, deadline)
+            if delay is None:
+                raise error
+            logger.warning(f"Retrying {url} in {delay:.2f}s after: {str(error) or repr(error)}")
+            await asyncio.sleep(delay)
+
+    async def fetch_and_parse(self, url: str) -> ScrapeResult:
+        """
+        Fetch one listings page and parse it (see TVListingsScraper.fetch_and_parse)
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError,
+            BudgetExceededError or RateLimitedError: If the page could not be
+            fetched
+        """
+        logger.info(f"Fetching TV listings from {url}")
+        previous = self.validators.get(url) if self.validators else None
+        headers = {}
+        if previous:
+            if previous['etag']:
+                headers['If-None-Match'] = previous['etag']
+            if previous['last_modified']:
+                headers['If-Modified-Since'] = previous['last_modified']
+
+        stream = self.pages.stream
+        deadline = self.policy.deadline()
+        async with self.limiter.slot_async(url, deadline):
+            body, charset, etag, last_modified = await self._fetch(
+                url, headers, previous, reader=self._stream_parse if stream else _read_body, deadline=deadline
+            )
+        if self.validators:
+            self.validators.count('requests')
+
+        if body is None:
+            logger.info(f"Not modified, reusing parsed result for {url}")
+            self.validators.count('not_modified')
+            return previous['result']
+
+        if stream:
+            listings, metadata, body_hash = body
+        else:
+            with span('body_hash'):
+                body_hash = hashlib.sha1(body).hexdigest()
+        if previous and previous['hash'] == body_hash:
+            logger.info(f"Unchanged body, reusing parsed result for {url}")
+            # A streamed page was parsed anyway; keep the earlier result so it stays the same object
+            self.validators.count('unchanged_streamed' if stream else 'unchanged_body')
+            return previous['result']
+
+        if not stream:
+            loop = asyncio.get_running_loop()
+            listings, metadata = await loop.run_in_executor(
+                self.parse_pool, self._decode_and_parse, body, charset
+            )
+        logger.info(f"Extracted {len(listings)} TV listings for {metadata['current_date']}")
+
+        if self.validators:
+            self.validators.count('parsed')
+            if listings:
+                self.validators.put(url, etag, last_modified, body_hash, listings, metadata)
+
+        return listings, metadata
+
+    async def fetch_metadata(self, url: str) -> Dict:
+        """
+        Read only the drupalSettings metadata of a listings page
+
+        The body is scanned as it arrives and the connection is dropped once
+        the settings have been read; no HTML is parsed.
+        """
+        logger.info(f"Fetching TV listings metadata from {url}")
+        deadline = self.policy.deadline()
+        async with self.limiter.slot_async(url, deadline):
+            scanner, _, _, _ = await self._fetch(url, {}, None, reader=_scan_settings, deadline=deadline)
+        return scanner.metadata()
+
+    async def scrape_metadata(self) -> Dict:
+        """Networks, dates and current date of today's page; {} on failure"""
+        try:
+            return await self.fetch_metadata(self.pages.date_url())
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError, BudgetExceededError,
+                RateLimitedError) as e:
+            logger.error(f"Error fetching metadata: {str(e) or repr(e)}")
+            return {}
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return {}
+
+    async def _scrape(self, url: str) -> ScrapeResult:
+        try:
+            return await self.fetch_and_parse(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError, BudgetExceededError,
+                RateLimitedError) as e:
+            logger.error(f"Error fetching data: {str(e) or repr(e)}")
+            return [], {}
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return [], {}
+
+    async def scrape_daily_schedule(self) -> ScrapeResult:
+        """Scrape the default (today) page; ([], {}) on failure"""
+        return await self._scrape(self.pages.date_url())
+
+    async def scrape_by_date(self, date_string: str = None, date_index: int = None) -> ScrapeResult:
+        """
+        Scrape TV listings for a specific date
+
+        Args:
+            date_string: Full date string (e.g., "Saturday, July 12")
+            date_index: Index of the date (0 = first date in list)
+
+        Returns:
+            Tuple of (listings, metadata), ([], {}) on failure
+        """
+        if date_index == 0:
+            date_string = None
+        elif not date_string and date_index is not None and date_index > 0:
+            dates = (await self.scrape_metadata()).get('dates', [])
+            if 0 <= date_index < len(dates):
+                date_string = dates[date_index]
+            else:
+                logger.warning(f"Invalid date index {date_index}. Using default URL.")
+        return await self._scrape(self.pages.date_url(date_string))
+
+    async def scrape_all_dates_detailed(self, max_workers: int = 4) -> Tuple[Dict[str, ScrapeResult], Dict, Dict]:
+        """
+        Scrape every available date concurrently
+
+        Same results, metadata and report as
+        TVListingsScraper.scrape_all_dates_detailed, with at most
+        ``max_workers`` pages in flight instead of one thread each.
+        """
+        started = time.monotonic()
+        results = {}
+        report = {'dates': {}, 'requests': 0}
+        limit = asyncio.Semaphore(max(1, max_workers))
+
+        async def scrape_one(date_string):
+            async with limit:
+                date_started = time.monotonic()
+                try:
+                    listings, date_metadata = await self.fetch_and_parse(self.pages.date_url(date_string))
+                    error = None
+                except Exception as e:
+                    listings, date_metadata, error = [], {}, str(e) or repr(e)
+                return listings, date_metadata, error, round(time.monotonic() - date_started, 3)
+
+        # The default page gives today's listings and the date list
+        today_listings, metadata, error, duration = await scrape_one(None)
+        report['requests'] += 1
+        available_dates = metadata.get('dates', [])
+
+        if not available_dates:
+            logger.warning(f"No dates found in metadata{f': {error}' if error else ''}")
+            report['error'] = error or 'No dates found in metadata'
+            report['duration'] = round(time.monotonic() - started, 3)
+            return results, metadata, report
+
+        logger.info(f"Scraping data for {len(available_dates)} dates: {available_dates}")
+        remaining = available_dates[1:]
+        outcomes = dict(zip(remaining, await asyncio.gather(*(scrape_one(d) for d in remaining))))
+        outcomes[available_dates[0]] = (today_listings, metadata, error, duration)
+        report['requests'] += len(remaining)
+
+        # Keep the site's date order
+        for date_string in available_dates:
+            listings, date_metadata, error, duration = outcomes[date_string]
+            report['dates'][date_string] = {
+                'duration': duration,
+                'listings': len(listings),
+                'error': error
+            }
+            if listings:
+                results[date_string] = (listings, date_metadata)
+                logger.info(f"✓ Scraped {len(listings)} listings for {date_string}")
+            else:
+                logger.warning(f"✗ No listings found for {date_string}")
+
+        report['duration'] = round(time.monotonic() - started, 3)
+        return results, metadata, report
+
+    async def scrape_all_dates(self, max_workers: int = 4) -> Dict[str, Tuple[List[Dict[str, str]], str]]:
+        """Date string -> (listings, date) for every available date"""
+        results, _, _ = await self.scrape_all_dates_detailed(max_workers=max_workers)
+        return {
+            date_string: (listings, date_metadata.get('current_date', date_string))
+            for date_string, (listings, date_metadata) in results.items()
+        }
+
+
+async def _in_context(values: Dict, awaitable: Awaitable):
+    # Carry the caller's context variables (e.g. the upstream request
+    # counter of the client request) into the task running on the loop
+    for var, value in values.items():
+        var.set(value)
+    return await awaitable
+
+
+class AsyncEngine:
+    """
+    Event loop in a background thread that runs every async scrape
+
+    All upstream I/O shares one aiohttp session (and connection pool) on
+    this loop, so the pages of a multi-date scrape download concurrently
+    without a thread each. Parsing runs in a small thread pool. Synchronous
+    callers use ``submit``/``run``, or EngineScraper where a
+    TVListingsScraper is expected; they block until the scrape finishes.
+    """
+
+    def __init__(self, max_concurrency: int = 8, timeout: float = 30, parse_workers: int = 2,
+                 **scraper_kwargs):
+        if not ASYNC_AVAILABLE:
+            raise RuntimeError("aiohttp is not installed")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.parse_workers = parse_workers
+        self.scraper_kwargs = scraper_kwargs
+        self.scraper: Optional[AsyncTVListingsScraper] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.submitted = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            # A forked worker has no loop thread, even if its parent had one
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='scrape-loop', daemon=True)
+            self._thread.start()
+            pool = ParsePool(self.parse_workers)
+            self.scraper = asyncio.run_coroutine_threadsafe(self._open(pool), self._loop).result()
+            logger.info(f"Async scrape engine started ({self.max_concurrency} concurrent pages)")
+
+    async def _open(self, pool: ParsePool) -> AsyncTVListingsScraper:
+        headers = {
+            name: value for name, value in TVListingsScraper.HEADERS.items()
+            # aiohttp advertises only the codings it can decode
+            if name != 'Accept-Encoding'
+        }
+        session = aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return AsyncTVListingsScraper(session, parse_pool=pool, max_concurrency=self.max_concurrency,
+                                      **self.scraper_kwargs)
+
+    def submit(self, fn: Callable[[AsyncTVListingsScraper], Awaitable]) -> Future:
+        """
+        Run ``fn(scraper)`` on the loop
+
+        Args:
+            fn: Callable taking the engine's AsyncTVListingsScraper and
+                returning an awaitable
+
+        Returns:
+            concurrent.futures.Future with the result
+        """
+        self._ensure_started()
+        values = dict(contextvars.copy_context())
+        future = asyncio.run_coroutine_threadsafe(_in_context(values, fn(self.scraper)), self._loop)
+        with self._lock:
+            self._pending += 1
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+
+    def run(self, fn: Callable[[AsyncTVListingsScraper], Awaitable]):
+        """Run ``fn(scraper)`` on the loop and wait for its result"""
+        return self.submit(fn).result()
+
+    def close(self):
+        """Close the HTTP session and stop the loop"""
+        with self._lock:
+            loop, scraper = self._loop, self.scraper
+            if not loop or not self._thread or not self._thread.is_alive() or self._pid != os.getpid():
+                return
+            self._thread = None
+        try:
+            asyncio.run_coroutine_threadsafe(scraper.session.close(), loop).result(timeout=5)
+        except Exception as e:
+            logger.error(f"Could not close the scrape session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+    def stats(self) -> Dict:
+        """Scrapes submitted and still running, for the status endpoint"""
+        with self._lock:
+            return {
+                'running': bool(self._thread and self._thread.is_alive()),
+                'max_concurrency': self.max_concurrency,
+                'submitted': self.submitted,
+                'pending': self._pending
+            }
+
+
+class EngineScraper:
+    """
+    Drop-in for TVListingsScraper that runs its scrapes on an AsyncEngine
+
+    Every method blocks the calling thread until the engine's scrape
+    finishes, just like TVListingsScraper; only the fetching is async.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    def scrape_daily_schedule(self) -> ScrapeResult:
+        return self.engine.run(lambda scraper: scraper.scrape_daily_schedule())
+
+    def scrape_metadata(self) -> Dict:
+        return self.engine.run(lambda scraper: scraper.scrape_metadata())
+
+    def scrape_by_date(self, date_string: str = None, date_index: int = None) -> ScrapeResult:
+        return self.engine.run(lambda scraper: scraper.scrape_by_date(date_string=date_string, date_index=date_index))
+
+    def scrape_all_dates_detailed(self, max_workers: int = 4) -> Tuple[Dict[str, ScrapeResult], Dict, Dict]:
+        return self.engine.run(lambda scraper: scraper.scrape_all_dates_detailed(max_workers=max_workers))
+
+    def scrape_all_dates(self, max_workers: int = 4) -> Dict[str, Tuple[List[Dict[str, str]], str]]:
+        return self.engine.run(lambda scraper: scraper.scrape_all_dates(max_workers=max_workers))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare memory per listing for plain listing dicts and the ListingStore
+
+Builds several days of synthetic listings shaped like the scraper's output
+and reports the bytes retained by each representation.
+
+Usage:
+    python benchmarks/listing_memory.py [--days 28] [--rows 450]
+"""
+
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from listing_schema import listing_normalizer  # noqa: E402
+from listing_store import ListingStore  # noqa: E402
+
+NETWORKS = ['ABC', 'CBS', 'NBC', 'FOX', 'PBS', 'TCM', 'HBO', 'AMC', 'Disney Channel', 'Hallmark Channel',
+            'Netflix', 'Discovery', 'National Geographic', 'Nickelodeon', 'Freeform', 'Lifetime']
+TITLES = ['Jeopardy!', 'Wheel of Fortune', 'Star Trek: The Next Generation', 'World News Tonight',
+          'Nature', 'Grey\'s Anatomy', 'The Simpsons', 'Bluey', 'Law & Order', 'NOVA']
+
+
+def fresh(text: str) -> str:
+    """A new string object with the same value, like a freshly parsed cell"""
+    return ''.join(list(text))
+
+
+def build_day(day: int, rows: int):
+    date = f"Day {day}, July {day + 1}"
+    listings = []
+    for row in range(rows):
+        hour, minute = divmod(row * 30 // len(NETWORKS) % 1440, 60)
+        is_movie = row % 9 == 0
+        title = TITLES[row % len(TITLES)]
+        program = f"{title} [MOVIE]" if is_movie else f"{title} - Episode {(day * rows + row) % 500}"
+        listings.append({
+            'time': fresh(f"{hour % 12 or 12}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"),
+            'network': fresh(NETWORKS[row % len(NETWORKS)]),
+            'program': fresh(program),
+            'date': fresh(date),
+            'is_movie': is_movie
+        })
+    return date, listing_normalizer.normalize(listings)
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    retained = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=28, help='days of history to hold')
+    parser.add_argument('--rows', type=int, default=450, help='listings per day')
+    args = parser.parse_args()
+
+    total = args.days * args.rows
+
+    dict_bytes, _ = measure(lambda: [build_day(day, args.rows) for day in range(args.days)])
+
+    def build_store():
+        store = ListingStore(max_dates=args.days)
+        for day in range(args.days):
+            date, listings = build_day(day, args.rows)
+            store.add(date, listings)
+            del listings
+        return store
+
+    store_bytes, store = measure(build_store)
+
+    # Round trip check: the store must give back the same listings
+    date, listings = build_day(0, args.rows)
+    assert store.listings(date) == listings, "ListingStore changed the listing shape"
+
+    print(f"{args.days} days x {args.rows} listings = {total} listings")
+    print(f"  dicts:        {dict_bytes / total:8.1f} bytes/listing ({dict_bytes / 1e6:.1f} MB)")
+    print(f"  ListingStore: {store_bytes / total:8.1f} bytes/listing ({store_bytes / 1e6:.1f} MB)")
+    print(f"  reduction:    {dict_bytes / store_bytes:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the listings page parsers
+
+Runs each parser function against the stored HTML fixtures (small, typical,
+a synthetic page with 10x the typical rows, and any pages captured from the
+live site) and reports median parse time, peak memory and live blocks. All
+three are compared with benchmarks/parser_baseline.json and the run exits
+with status 1 when any of them regresses past the tolerance. No network
+access is needed, except to capture a page.
+
+Live blocks are the memory blocks allocated during a parse that are still
+allocated when it returns (the result and anything it keeps alive).
+tracemalloc only traces blocks that are alive, so short-lived allocations
+cannot be counted one by one; their cost shows up in peak memory and time.
+
+Usage:
+    python benchmarks/parser_benchmark.py [--repeat 5] [--tolerance 1.5]
+    python benchmarks/parser_benchmark.py --update-baseline
+    python benchmarks/parser_benchmark.py --capture   # save today's live page as a fixture
+"""
+
+import argparse
+import gc
+import glob
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from page_parser import STREAM_CHUNK_SIZE, DrupalSettingsScanner, parse_listings_chunks, parse_listings_page  # noqa: E402
+from scraper import TVListingsScraper, listings_url  # noqa: E402
+
+FIXTURE_DIR = os.path.join(BENCH_DIR, 'fixtures')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'parser_baseline.json')
+
+# Time differences below this are treated as noise
+MIN_TIME_SLACK_MS = 2.0
+
+# Live-block differences below this are treated as noise (interning, caches)
+MIN_BLOCK_SLACK = 50
+
+
+def load_fixtures():
+    """Fixture name -> HTML for every stored page, plus the synthetic 10x page"""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            fixtures[os.path.splitext(os.path.basename(path))[0]] = f.read()
+
+    # Repeat the typical page's table body ten times
+    typical = fixtures['typical']
+    match = re.search(r'(<tbody>)(.*?)(</tbody>)', typical, re.DOTALL)
+    fixtures['typical_10x'] = typical[:match.start(2)] + match.group(2) * 10 + typical[match.end(2):]
+    return fixtures
+
+
+def capture_fixture() -> str:
+    """Save today's live listings page as a fixture and return its path"""
+    scraper = TVListingsScraper(validators=None)
+    response = scraper.session.get(listings_url(), timeout=30)
+    response.raise_for_status()
+    path = os.path.join(FIXTURE_DIR, f'captured-{date.today().isoformat()}.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    return path
+
+
+def scan_metadata(html):
+    """Metadata-only path: scan the encoded page for drupalSettings"""
+    scanner = DrupalSettingsScanner()
+    scanner.feed(html.encode('utf-8'))
+    return scanner.metadata()
+
+
+def stream_listings_page(html):
+    """Streaming path: parse the encoded page in download-sized chunks"""
+    body = html.encode('utf-8')
+    chunks = (body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE))
+    listings, metadata, _ = parse_listings_chunks(chunks, encoding='utf-8')
+    return listings, metadata
+
+
+def parser_functions():
+    soup = TVListingsScraper(parser='soup', validators=None)
+    return {
+        'extract_table_data': soup.extract_table_data,
+        'extract_drupal_settings': soup.extract_drupal_settings,
+        'extract_metadata': soup.extract_metadata,
+        'parse_listings_page': parse_listings_page,
+        'scan_metadata': scan_metadata,
+        'stream_listings_page': stream_listings_page,
+    }
+
+
+def measure(function, html, repeat):
+    """Median time in ms, peak memory in KB and blocks still live when the parse returns"""
+    function(html)  # warm up
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(html)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function(html)
+    _, peak = tracemalloc.get_traced_memory()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    live_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del result
+
+    return {
+        'time_ms': round(statistics.median(timings), 3),
+        'peak_kb': round(peak / 1024, 1),
+        'live_blocks': live_blocks
+    }
+
+
+def check_equivalence(fixtures):
+    """The single-pass parser must match the BeautifulSoup extractors"""
+    soup = TVListingsScraper(parser='soup', validators=None)
+    for name, html in fixtures.items():
+        expected = (soup.extract_table_data(html), soup.extract_metadata(html))
+        if parse_listings_page(html) != expected:
+            raise SystemExit(f"parse_listings_page output differs from the soup parser on {name}")
+        if stream_listings_page(html) != expected:
+            raise SystemExit(f"stream_listings_page output differs from the soup parser on {name}")
+        if scan_metadata(html) != expected[1]:
+            raise SystemExit(f"scan_metadata output differs from the soup parser on {name}")
+
+
+def regressions(results, baseline, tolerance):
+    """Descriptions of every measurement worse than baseline * tolerance"""
+    found = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        if current['time_ms'] > previous['time_ms'] * tolerance + MIN_TIME_SLACK_MS:
+            found.append(f"{key}: time {current['time_ms']}ms vs baseline {previous['time_ms']}ms")
+        if current['peak_kb'] > previous['peak_kb'] * tolerance:
+            found.append(f"{key}: peak memory {current['peak_kb']}KB vs baseline {previous['peak_kb']}KB")
+        if 'live_blocks' in previous and (
+                current['live_blocks'] > max(previous['live_blocks'], 0) * tolerance + MIN_BLOCK_SLACK):
+            found.append(f"{key}: {current['live_blocks']} live blocks vs baseline {previous['live_blocks']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per measurement')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='allowed ratio to the baseline before failing')
+    parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--capture', action='store_true',
+                        help="save today's live page as a fixture (then --update-baseline to gate it)")
+    args = parser.parse_args()
+
+    if args.capture:
+        print(f"Captured {capture_fixture()}")
+        return
+
+    logging.disable(logging.WARNING)
+    fixtures = load_fixtures()
+    check_equivalence(fixtures)
+
+    results = {}
+    print(f"{'fixture':<12} {'function':<24} {'time ms':>9} {'peak KB':>9} {'blocks':>8}")
+    for fixture, html in fixtures.items():
+        for function_name, function in parser_functions().items():
+            measurement = measure(function, html, args.repeat)
+            results[f'{fixture}/{function_name}'] = measurement
+            print(f"{fixture:<12} {function_name:<24} {measurement['time_ms']:>9.3f} "
+                  f"{measurement['peak_kb']:>9.1f} {measurement['live_blocks']:>8}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline written to {BASELINE_PATH}")
+        return
+
+    if not os.path.exists(BASELINE_PATH):
+        print("\nNo baseline yet; run with --update-baseline to record one")
+        return
+
+    with open(BASELINE_PATH, encoding='utf-8') as f:
+        baseline = json.load(f)
+    found = regressions(results, baseline, args.tolerance)
+    if found:
+        print("\nRegressions:")
+        for description in found:
+            print(f"  {description}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,450 @@
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from listing_schema import listing_normalizer
+
+logger = logging.getLogger(__name__)
+
+ScrapeResult = Tuple[List[Dict[str, str]], Dict]
+
+# Cache key for the site's default (today) page
+TODAY_KEY = 'today'
+
+
+def content_hash(listings: List[Dict[str, str]], metadata: Dict) -> str:
+    """Stable hash of a parsed scrape result"""
+    payload = json.dumps([listings, metadata], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class CacheEntry:
+    """A cached scrape result, its version and the times it was scraped and stored"""
+
+    __slots__ = ('listings', 'metadata', 'stored_at', 'version', 'digest', 'scraped_at')
+
+    def __init__(self, listings: List[Dict[str, str]], metadata: Dict, stored_at: float,
+                 version: int = 0, digest: str = '', scraped_at: float = None):
+        self.listings = listings
+        self.metadata = metadata
+        self.stored_at = stored_at
+        self.version = version
+        self.digest = digest
+        # Wall-clock time.time() of the scrape
+        self.scraped_at = time.time() if scraped_at is None else scraped_at
+
+
+class _Call:
+    """An in-flight call and, once done, its outcome"""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key
+
+    The first caller for a key runs the function; callers arriving while it is
+    running wait for it and receive the same result (or exception). Calls with
+    different keys run independently. Callers that pass a ``timeout`` stop
+    waiting after it, while the call itself carries on in the background.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable, timeout: float = None):
+        """
+        Run ``fn`` for a key, or wait for the call already running for it
+
+        Args:
+            key: Identifies the work being done (e.g. a date string)
+            fn: Callable producing the result
+            timeout: Seconds to wait for the result; the first caller then
+                runs ``fn`` in a background thread instead of its own
+
+        Returns:
+            The result of the single shared call
+
+        Raises:
+            TimeoutError: If the result was not ready within ``timeout``
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if leader:
+            if timeout is None:
+                self._run(key, call, fn)
+            else:
+                # Keep the caller's context (e.g. metrics attribution) in the thread
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(self._run, key, call, fn),
+                                 name=f'load-{key}', daemon=True).start()
+
+        if not call.done.wait(timeout):
+            raise TimeoutError(f"{key} was not loaded within {timeout}s")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _run(self, key: str, call: _Call, fn: Callable):
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> Dict[str, int]:
+        """Keys currently being loaded and how many callers wait on each"""
+        with self._lock:
+            return {key: call.waiters for key, call in self._calls.items()}
+
+
+class ListingsCache:
+    """
+    Per-date cache of parsed (listings, metadata) results
+
+    Entries are fresh for ``ttl`` seconds. After that they are served stale
+    while a background thread refreshes them. Once the cache holds more than
+    ``max_entries`` dates the least recently used one is evicted. Concurrent
+    loads of the same date share one upstream fetch.
+
+    Each distinct result stored for a date gets a new version number, unique
+    within the process and increasing across restarts. The listings of the
+    last ``keep_versions`` versions are kept so clients can ask for deltas.
+
+    If ``shared`` is set (an object whose ``claim(key, max_age)`` context
+    yields a result another process scraped within the TTL, or None, such as
+    shared_cache.SharedLoads) a load only calls the loader when the claim
+    yields nothing, and does so inside the claim.
+    """
+
+    def __init__(self, ttl: float = 900, max_entries: int = 16, keep_versions: int = 5):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.keep_versions = keep_versions
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._versions: Dict[str, deque] = {}
+        self._last_version = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.flight = SingleFlight()
+        self._listeners: List[Callable[[str, List[Dict[str, str]], Dict], None]] = []
+        self._touch_listeners: List[Callable[[str], None]] = []
+        self.shared = None
+        self.shared_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key: str, loader: Callable[[], ScrapeResult]) -> ScrapeResult:
+        """
+        Get the result for a date, loading it on a miss
+
+        Args:
+            key: Date string the result is cached under
+            loader: Callable returning a fresh (listings, metadata) tuple
+
+        Returns:
+            Tuple of (listings, metadata)
+        """
+        entry = self.get_entry(key, loader)
+        return entry.listings, entry.metadata
+
+    def get_entry(self, key: str, loader: Callable[[], ScrapeResult], timeout: float = None) -> CacheEntry:
+        """
+        Like get(), but returns the entry with its version and digest
+
+        With a ``timeout``, a miss waits at most that long for the load
+        (which still completes and is cached) before raising TimeoutError.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now - entry.stored_at < self.ttl:
+                    self.hits += 1
+                    return entry
+                self.stale += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                return entry
+            self.misses += 1
+
+        return self.load(key, loader, timeout)
+
+    def load(self, key: str, loader: Callable[[], ScrapeResult], timeout: float = None) -> CacheEntry:
+        """Load a date and store it, joining any load already in flight for it"""
+        def load_and_store():
+            if self.shared is None:
+                listings, metadata = loader()
+                return self.put(key, listings, metadata)
+            with self.shared.claim(key, self.ttl) as result:
+                if result:
+                    self.shared_hits += 1
+                    return self.put(key, *result)
+                listings, metadata = loader()
+                return self.put(key, listings, metadata)
+
+        return self.flight.do(key, load_and_store, timeout)
+
+    def peek(self, key: str) -> Optional[ScrapeResult]:
+        """Return the cached result for a date without loading or counting it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return (entry.listings, entry.metadata) if entry else None
+
+    def peek_entry(self, key: str) -> Optional[CacheEntry]:
+        """Return the cached entry for a date without loading or counting it"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def previous_listings(self, key: str, version: int) -> Optional[List[Dict[str, str]]]:
+        """Listings of an earlier version of a date, if still retained"""
+        with self._lock:
+            for retained_version, _, listings in self._versions.get(key, ()):
+                if retained_version == version:
+                    return listings
+        return None
+
+    def _next_version(self) -> int:
+        # Millisecond clock so versions keep increasing across restarts
+        self._last_version = max(self._last_version + 1, int(time.time() * 1000))
+        return self._last_version
+
+    def add_listener(self, listener: Callable[[str, List[Dict[str, str]], Dict], None]):
+        """Call ``listener(key, listings, metadata)`` whenever a result is stored"""
+        self._listeners.append(listener)
+
+    def add_touch_listener(self, listener: Callable[[str], None]):
+        """Call ``listener(key)`` whenever a cached date is revalidated unchanged"""
+        self._touch_listeners.append(listener)
+
+    def put(self, key: str, listings: List[Dict[str, str]], metadata: Dict,
+            stale: bool = False, scraped_at: float = None) -> CacheEntry:
+        """
+        Store a result, ignoring empty (failed) scrapes
+
+        Args:
+            key: Date string the result is cached under
+            listings: Parsed listings
+            metadata: Parsed metadata
+            stale: Store it as already expired, so the next read refreshes it
+            scraped_at: time.time() the result was scraped, if not just now
+
+        Returns:
+            The stored entry (an unversioned one for an empty result)
+        """
+        if not listings:
+            return CacheEntry(listings, metadata, time.monotonic())
+        digest = content_hash(listings, metadata)
+        stored_at = time.monotonic() - (self.ttl if stale else 0)
+        with self._lock:
+            versions = self._versions.get(key)
+            if versions is None:
+                versions = self._versions[key] = deque(maxlen=self.keep_versions)
+            if versions and versions[-1][1] == digest:
+                version = versions[-1][0]
+            else:
+                version = self._next_version()
+                versions.append((version, digest, listings))
+            entry = self._entries[key] = CacheEntry(listings, metadata, stored_at, version, digest, scraped_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._versions.pop(evicted, None)
+                self.evictions += 1
+                logger.info(f"Evicted cached listings for {evicted}")
+
+        for listener in self._listeners:
+            try:
+                listener(key, listings, metadata)
+            except Exception as e:
+                logger.error(f"Cache listener failed for {key}: {e}")
+        return entry
+
+    def touch(self, key: str, notify: bool = True) -> bool:
+        """
+        Mark a cached date as freshly validated without replacing it
+
+        Args:
+            key: Date string the result is cached under
+            notify: Call the touch listeners (False when the validation
+                happened elsewhere, e.g. in another worker)
+
+        Returns:
+            False if the date is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.stored_at = time.monotonic()
+
+        if notify:
+            for listener in self._touch_listeners:
+                try:
+                    listener(key)
+                except Exception as e:
+                    logger.error(f"Cache touch listener failed for {key}: {e}")
+        return True
+
+    def keys(self) -> List[str]:
+        """Cached date keys, least recently used first"""
+        with self._lock:
+            return list(self._entries)
+
+    def invalidate(self, key: str = None):
+        """Drop one date from the cache, or every date if no key is given"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._versions.clear()
+            else:
+                self._entries.pop(key, None)
+                self._versions.pop(key, None)
+
+    def _refresh(self, key: str, loader: Callable[[], ScrapeResult]):
+        try:
+            logger.info(f"Refreshing stale listings for {key}")
+            self.load(key, loader)
+        except Exception as e:
+            logger.error(f"Background refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> Dict:
+        """Counters and size for the status endpoint"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'refreshing': sorted(self._refreshing),
+                'in_flight': self.flight.in_flight(),
+                'shared_loads': self.flight.shared,
+                'shared_hits': self.shared_hits
+            }
+
+
+class MetadataCache:
+    """
+    Cache of the site metadata (available dates, networks, current date)
+
+    Kept apart from the listings with its own, usually longer, TTL, and
+    never kept past midnight in the listings' time zone (LISTINGS_TZ), when
+    the site's date window moves.
+    Concurrent loads share one fetch and an expired value is served while a
+    background thread refreshes it.
+    """
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self._metadata: Optional[Dict] = None
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _expiry(self) -> float:
+        now = listing_normalizer.now()
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return min(time.time() + self.ttl, midnight.timestamp())
+
+    def get(self, loader: Callable[[], Dict], timeout: float = None) -> Dict:
+        """
+        The cached metadata, loading it on a miss
+
+        Args:
+            loader: Callable returning fresh metadata ({} on failure)
+            timeout: Seconds a miss waits for the load before TimeoutError
+
+        Returns:
+            Metadata dict, empty if it could not be loaded
+        """
+        with self._lock:
+            if self._metadata is not None:
+                if time.time() < self._expires_at:
+                    self.hits += 1
+                    return self._metadata
+                self.stale += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, args=(loader,), daemon=True).start()
+                return self._metadata
+            self.misses += 1
+
+        return self.flight.do('metadata', lambda: self._load(loader), timeout)
+
+    def _load(self, loader: Callable[[], Dict]) -> Dict:
+        metadata = loader()
+        self.put(metadata)
+        return metadata
+
+    def _refresh(self, loader: Callable[[], Dict]):
+        try:
+            self.flight.do('metadata', lambda: self._load(loader))
+        except Exception as e:
+            logger.error(f"Metadata refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def put(self, metadata: Dict):
+        """Store metadata read elsewhere (e.g. with a full page); ignores failed reads"""
+        if not metadata or not metadata.get('dates'):
+            return
+        with self._lock:
+            self._metadata = metadata
+            self._expires_at = self._expiry()
+
+    def peek(self) -> Optional[Dict]:
+        """The cached metadata, even if expired, without loading"""
+        with self._lock:
+            return self._metadata
+
+    def stats(self) -> Dict:
+        """Counters for the status endpoint"""
+        with self._lock:
+            return {
+                'cached': self._metadata is not None,
+                'ttl': self.ttl,
+                'expires_in': round(self._expires_at - time.time(), 1) if self._metadata is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale
+            }
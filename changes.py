@@ -0,0 +1,234 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from listing_store import DateBlock, ListingStore
+
+# (minutes, raw time string, network id, program) of a block row
+RowKey = Tuple[int, Optional[str], int, str]
+
+CHANGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    version INTEGER,
+    from_hash TEXT,
+    to_hash TEXT,
+    detected_at TEXT NOT NULL,
+    added TEXT NOT NULL,
+    removed TEXT NOT NULL
+)
+"""
+
+
+def row_keys(block: DateBlock) -> Dict[RowKey, int]:
+    """Identity of each row of a block across scrapes (time, network, program) -> row"""
+    raw_times = block.raw_times
+    return {(minutes, raw_times.get(row), network, program): row
+            for row, (minutes, network, program) in enumerate(zip(block.times, block.networks, block.programs))}
+
+
+class PersistedChanges:
+    """
+    Change records in a SQLite file (the snapshot database)
+
+    Every worker using the file serves the same feed, and it survives
+    restarts. Sequence numbers are allocated inside the INSERT, so they keep
+    increasing whichever worker records a change; a change another worker
+    has just recorded (same date and content hashes) is not added again.
+    """
+
+    def __init__(self, path: str, max_changes: int = 1000):
+        self.path = path
+        self.max_changes = max_changes
+        with self._connect() as connection:
+            connection.execute(CHANGES_SCHEMA)
+            connection.execute('CREATE INDEX IF NOT EXISTS changes_date ON changes (date, seq)')
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed"""
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _row_to_change(row) -> Dict:
+        seq, date, version, detected_at, added, removed = row
+        return {'seq': seq, 'date': date, 'version': version, 'detected_at': detected_at,
+                'added': json.loads(added), 'removed': json.loads(removed)}
+
+    def add(self, change: Dict, from_hash: Optional[str], to_hash: Optional[str]) -> Optional[int]:
+        """
+        Record a change, dropping all but the newest ``max_changes``
+
+        Returns:
+            Its sequence number, or None if the same change was just recorded
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO changes SELECT MAX(COALESCE((SELECT MAX(seq) FROM changes), 0) + 1, ?), '
+                '?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS ('
+                '  SELECT 1 FROM (SELECT from_hash, to_hash FROM changes WHERE date = ? ORDER BY seq DESC LIMIT 1) '
+                '  WHERE from_hash IS ? AND to_hash IS ?'
+                ')',
+                (int(time.time() * 1000), change['date'], change['version'], from_hash, to_hash,
+                 change['detected_at'], json.dumps(change['added'], separators=(',', ':')),
+                 json.dumps(change['removed'], separators=(',', ':')), change['date'], from_hash, to_hash)
+            )
+            if not cursor.rowcount:
+                return None
+            connection.execute(
+                'DELETE FROM changes WHERE seq <= (SELECT seq FROM changes ORDER BY seq DESC LIMIT 1 OFFSET ?)',
+                (self.max_changes,)
+            )
+            return cursor.lastrowid
+
+    def since(self, seq: int = 0, date: str = None, limit: int = 100) -> Tuple[List[Dict], bool]:
+        query = 'SELECT seq, date, version, detected_at, added, removed FROM changes WHERE seq > ?'
+        params: list = [seq]
+        if date is not None:
+            query += ' AND date = ?'
+            params.append(date)
+        with self._connect() as connection:
+            rows = connection.execute(query + ' ORDER BY seq LIMIT ?', params + [limit + 1]).fetchall()
+        return [self._row_to_change(row) for row in rows[:limit]], len(rows) > limit
+
+    def latest_seq(self) -> int:
+        with self._connect() as connection:
+            return connection.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+
+    def count(self) -> int:
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM changes').fetchone()[0]
+
+
+class ChangeLog:
+    """
+    Detects schedule changes between successive snapshots of each date
+
+    The first snapshot of a date is its baseline. Each later snapshot is
+    compared with the previous one by (time, network, program); if anything
+    was added or removed a change record is appended to a bounded log.
+    Records get increasing sequence numbers (millisecond based, so they keep
+    increasing across restarts) for ``since=`` polling.
+
+    Snapshots are the ListingStore's column blocks: only a reference to the
+    last block seen per date is kept (normally the one the store holds), and
+    listing dicts are materialized just for the rows that changed. With
+    ``persisted`` the records live in its SQLite file; otherwise they are
+    kept in memory only and lost on restart.
+    """
+
+    def __init__(self, store: ListingStore, max_changes: int = 1000, max_dates: int = 60,
+                 persisted: Optional[PersistedChanges] = None):
+        self.store = store
+        self.max_changes = max_changes
+        self.max_dates = max_dates
+        self.persisted = persisted
+        self._changes: deque = deque(maxlen=max_changes)
+        self._previous: Dict[str, Tuple[DateBlock, Optional[str]]] = {}
+        self._last_seq = 0
+        self._lock = threading.Lock()
+
+    def _next_seq(self) -> int:
+        self._last_seq = max(self._last_seq + 1, int(time.time() * 1000))
+        return self._last_seq
+
+    def observe(self, date: str, block: DateBlock, version: int = None, digest: str = None) -> Optional[Dict]:
+        """
+        Compare a new snapshot of a date with the previous one
+
+        Args:
+            date: Date string the listings belong to
+            block: The store's block of the newly scraped listings
+            version: Cache version of the snapshot, reported with the change
+            digest: Content hash of the snapshot
+
+        Returns:
+            The change record appended to the log, or None if nothing changed
+        """
+        with self._lock:
+            previous = self._previous.pop(date, None)
+            self._previous[date] = (block, digest)
+            while len(self._previous) > self.max_dates:
+                del self._previous[next(iter(self._previous))]
+        if previous is None:
+            return None
+        previous_block, previous_digest = previous
+        if previous_block is block or (digest is not None and digest == previous_digest):
+            return None
+
+        previous_keys = row_keys(previous_block)
+        current_keys = row_keys(block)
+        added = [row for key, row in current_keys.items() if key not in previous_keys]
+        removed = [row for key, row in previous_keys.items() if key not in current_keys]
+        if not added and not removed:
+            return None
+
+        change = {
+            'date': date,
+            'version': version,
+            'detected_at': datetime.now(timezone.utc).isoformat(),
+            'added': list(self.store.rows(block, added)),
+            'removed': list(self.store.rows(previous_block, removed))
+        }
+        if self.persisted:
+            seq = self.persisted.add(change, previous_digest, digest)
+            if seq is None:
+                return None
+            change['seq'] = seq
+            return change
+        with self._lock:
+            change['seq'] = self._next_seq()
+            self._changes.append(change)
+        return change
+
+    def since(self, seq: int = 0, date: str = None, limit: int = 100) -> Tuple[List[Dict], bool]:
+        """
+        Change records newer than a sequence number, oldest first
+
+        Args:
+            seq: Only records with a larger sequence number
+            date: Only records for this date
+            limit: Maximum number of records
+
+        Returns:
+            Tuple of (records, has_more)
+        """
+        if self.persisted:
+            return self.persisted.since(seq, date, limit)
+        with self._lock:
+            matches = [change for change in self._changes
+                       if change['seq'] > seq and (date is None or change['date'] == date)]
+        return matches[:limit], len(matches) > limit
+
+    def latest_seq(self) -> int:
+        """Sequence number of the newest record, or 0"""
+        if self.persisted:
+            return self.persisted.latest_seq()
+        with self._lock:
+            return self._changes[-1]['seq'] if self._changes else 0
+
+    def stats(self) -> Dict:
+        """Size of the log for the status endpoint"""
+        if self.persisted:
+            changes, latest_seq = self.persisted.count(), self.persisted.latest_seq()
+        else:
+            with self._lock:
+                changes, latest_seq = len(self._changes), self._changes[-1]['seq'] if self._changes else 0
+        return {
+            'changes': changes,
+            'max_changes': self.max_changes,
+            'dates_tracked': len(self._previous),
+            'persisted': self.persisted.path if self.persisted else None,
+            'latest_seq': latest_seq
+        }
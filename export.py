@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Export TV listings to JSONL, CSV or Parquet without the web app
+
+Scrapes every available date (or reads the newest snapshot of each date from
+the snapshot database) and streams the rows to the output one date at a time,
+so memory use does not grow with the number of dates. Each row is a listing
+with its normalized fields and the time it was scraped. The output is
+replaced only when the export finishes and read at least one date, so a
+failed run leaves the previous export in place.
+
+With --append, the new rows are written to a side file and added to the end
+of an existing export when the run finishes, without rewriting what is
+already there (a .gz output gets a new gzip member). Dates whose listings
+have not changed since the last run are skipped (tracked in
+OUTPUT.state.json). A changed date is written again, so consumers should
+keep the rows with the latest scraped_at for each date.
+
+Parquet output is a directory of part files, one per run, and needs pyarrow.
+
+Usage:
+    python export.py listings.jsonl
+    python export.py listings.csv.gz --source snapshots --append
+    python export.py listings.parquet --workers 8
+    python export.py - --format csv | head
+"""
+
+import argparse
+import csv
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Tuple
+
+from cache import content_hash
+from rate_limit import upstream_limiter
+from snapshot_store import SnapshotStore
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ['date', 'start', 'time', 'minutes', 'network', 'network_id', 'program', 'title', 'episode',
+          'is_movie', 'scraped_at']
+
+FORMATS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl', '.csv': 'csv', '.parquet': 'parquet'}
+
+DEFAULT_SNAPSHOT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots.db')
+
+
+def temp_path_for(path: str) -> str:
+    """Hidden name next to an output path, keeping its extensions"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.tmp-{os.getpid()}-{name}')
+
+
+def open_text(path: str):
+    """Text stream writing a new file: gzip for a .gz path"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+class JsonlWriter:
+    """
+    One JSON object per line
+
+    Rows go to a temporary file, so a failed export leaves the previous one
+    as it was. On commit the file replaces the output, or when appending to
+    an existing output its bytes are added to the end of it.
+    """
+
+    def __init__(self, path: str, append: bool):
+        self.path = path
+        self.rows = 0
+        if path == '-':
+            self.temp_path = None
+            self.stream = sys.stdout
+            return
+        self.temp_path = temp_path_for(path)
+        self.append = append and os.path.exists(path)
+        self.stream = open_text(self.temp_path)
+
+    def write(self, rows: List[Dict]):
+        self.stream.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        self.rows += len(rows)
+
+    def commit(self):
+        """Finish the output and put it in place"""
+        if self.temp_path is None:
+            self.stream.flush()
+            return
+        self.stream.close()
+        if not self.append:
+            os.replace(self.temp_path, self.path)
+            return
+        try:
+            if self.rows:
+                with open(self.path, 'ab') as output, open(self.temp_path, 'rb') as new_rows:
+                    size = output.tell()
+                    try:
+                        shutil.copyfileobj(new_rows, output)
+                    except BaseException:
+                        # Leave the output as it was rather than with half the rows
+                        output.truncate(size)
+                        raise
+        finally:
+            os.remove(self.temp_path)
+
+    def discard(self):
+        """Drop what was written, leaving the output as it was"""
+        if self.temp_path is None:
+            self.stream.flush()
+            return
+        self.stream.close()
+        os.remove(self.temp_path)
+
+
+class CsvWriter(JsonlWriter):
+    """CSV with a header row (not repeated when appending to a non-empty file)"""
+
+    def __init__(self, path: str, append: bool):
+        has_header = append and path != '-' and os.path.exists(path) and os.path.getsize(path) > 0
+        super().__init__(path, append)
+        self.writer = csv.DictWriter(self.stream, fieldnames=FIELDS)
+        if not has_header:
+            self.writer.writeheader()
+
+    def write(self, rows: List[Dict]):
+        self.writer.writerows(rows)
+        self.rows += len(rows)
+
+
+class ParquetWriter:
+    """
+    Zstd-compressed Parquet part file in an output directory
+
+    Each date becomes a row group. The part file is written under a hidden
+    name and renamed into place on commit, so readers of the directory never
+    see a partial file. Without append, earlier part files are removed once
+    the new one is in place.
+    """
+
+    def __init__(self, path: str, append: bool):
+        if pyarrow is None:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.schema = pyarrow.schema([
+            ('date', pyarrow.string()), ('start', pyarrow.string()), ('time', pyarrow.string()),
+            ('minutes', pyarrow.int16()), ('network', pyarrow.string()), ('network_id', pyarrow.string()),
+            ('program', pyarrow.string()), ('title', pyarrow.string()), ('episode', pyarrow.string()),
+            ('is_movie', pyarrow.bool_()), ('scraped_at', pyarrow.string())
+        ])
+        os.makedirs(path, exist_ok=True)
+        self.directory = path
+        self.append = append
+        name = f"part-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:12]}.parquet"
+        self.path = os.path.join(path, name)
+        self.temp_path = os.path.join(path, '.' + name)
+        self.writer = None
+
+    def write(self, rows: List[Dict]):
+        if not rows:
+            return
+        if self.writer is None:
+            self.writer = pyarrow.parquet.ParquetWriter(self.temp_path, self.schema, compression='zstd')
+        self.writer.write_table(pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def commit(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self.temp_path, self.path)
+        if not self.append:
+            for part in glob.glob(os.path.join(self.directory, 'part-*.parquet')):
+                if part != self.path:
+                    os.remove(part)
+
+    def discard(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.remove(self.temp_path)
+
+
+WRITERS = {'jsonl': JsonlWriter, 'csv': CsvWriter, 'parquet': ParquetWriter}
+
+
+def output_format(path: str) -> str:
+    """Format implied by an output path's extension (ignoring .gz), JSONL if unknown"""
+    stem = path[:-3] if path.endswith('.gz') else path
+    return FORMATS.get(os.path.splitext(stem)[1].lower(), 'jsonl')
+
+
+def scraped_dates(workers: int) -> Iterator[Tuple[str, List[Dict], str]]:
+    """(date header, listings, scrape time) for every date, scraped live"""
+    from scraper import TVListingsScraper
+
+    for date_string, listings, metadata in TVListingsScraper().iter_dates(max_workers=workers):
+        if not listings:
+            logger.warning(f"No listings scraped for {date_string}")
+            continue
+        yield metadata.get('current_date', date_string), listings, datetime.now(timezone.utc).isoformat()
+
+
+def snapshot_dates(path: str, max_age: float = None) -> Iterator[Tuple[str, List[Dict], str]]:
+    """(date header, listings, scrape time) of the newest snapshot of every date, oldest scrape first"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No snapshot database at {path}")
+    store = SnapshotStore(path)
+    # Today's page and its date string may both be stored; keep the newer
+    newest = {}
+    for header in store.headers(max_age=max_age):
+        current = newest.get(header['current_date'])
+        if current is None or header['scraped_at_epoch'] > current['scraped_at_epoch']:
+            newest[header['current_date']] = header
+    for header in sorted(newest.values(), key=lambda header: header['scraped_at_epoch']):
+        snapshot = store.latest(header['date_key'])
+        if snapshot and snapshot['listings']:
+            yield snapshot['current_date'], snapshot['listings'], snapshot['scraped_at']
+
+
+def load_state(path: str) -> Dict:
+    try:
+        with open(path, encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path: str, state: Dict):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def export(dates: Iterator[Tuple[str, List[Dict], str]], writer, state: Dict, append: bool) -> Dict:
+    """
+    Write each date's rows, skipping dates unchanged since the last export when appending
+
+    Args:
+        dates: (date header, listings, scrape time) tuples
+        writer: Output writer
+        state: Date header -> listings hash and row count of the last export,
+            updated in place
+
+    Returns:
+        Totals: dates written and skipped, rows and seconds
+    """
+    started = time.monotonic()
+    totals = {'dates': 0, 'skipped': 0, 'rows': 0}
+    for date_header, listings, scraped_at in dates:
+        digest = content_hash(listings, {})
+        if append and state.get(date_header, {}).get('listings_hash') == digest:
+            totals['skipped'] += 1
+            continue
+
+        date_started = time.monotonic()
+        writer.write([dict({field: listing.get(field) for field in FIELDS}, scraped_at=scraped_at)
+                      for listing in listings])
+        seconds = time.monotonic() - date_started
+        totals['dates'] += 1
+        totals['rows'] += len(listings)
+        state[date_header] = {'listings_hash': digest, 'rows': len(listings), 'scraped_at': scraped_at}
+        logger.info(f"{date_header}: {len(listings)} rows ({len(listings) / max(seconds, 1e-6):,.0f} rows/s)")
+    totals['seconds'] = time.monotonic() - started
+    return totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help="output file (directory for Parquet), or '-' for stdout")
+    parser.add_argument('--format', choices=sorted(WRITERS), help='default: from the output extension')
+    parser.add_argument('--source', choices=['scrape', 'snapshots'], default='scrape',
+                        help='scrape the site (default) or read the snapshot database')
+    parser.add_argument('--db', default=os.environ.get('SNAPSHOT_DB', DEFAULT_SNAPSHOT_DB),
+                        help='snapshot database for --source snapshots')
+    parser.add_argument('--max-age', type=float, help='only snapshots scraped within this many seconds')
+    parser.add_argument('--workers', type=int, default=4, help='dates scraped in parallel')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='skip a date instead of waiting when the upstream rate limit is reached')
+    parser.add_argument('--append', action='store_true',
+                        help='add to the output, skipping dates unchanged since the last export')
+    args = parser.parse_args()
+
+    # Progress from this script only; the scraper's own logging stays at warnings
+    logging.basicConfig(level=logging.WARNING, format='%(message)s', stream=sys.stderr)
+    logger.setLevel(logging.INFO)
+    export_format = args.format or output_format(args.output)
+    if args.output == '-' and (args.append or export_format == 'parquet'):
+        parser.error("stdout output cannot be appended to or written as Parquet")
+
+    state_path = None if args.output == '-' else args.output.rstrip('/\\') + '.state.json'
+    state = load_state(state_path) if args.append and state_path else {}
+
+    if args.source == 'snapshots':
+        dates = snapshot_dates(args.db, args.max_age)
+    else:
+        # Share the web app's upstream rate limit when its snapshot file is here
+        if os.path.exists(args.db):
+            upstream_limiter.shared_path = args.db
+        upstream_limiter.fail_fast = args.fail_fast
+        dates = scraped_dates(args.workers)
+
+    try:
+        writer = WRITERS[export_format](args.output, args.append)
+        try:
+            totals = export(dates, writer, state, args.append)
+        except BaseException:
+            writer.discard()
+            raise
+        # Keep the previous export (and its state) when nothing could be read
+        committed = bool(totals['dates'] or totals['skipped'])
+        if committed:
+            writer.commit()
+        else:
+            writer.discard()
+    except (OSError, RuntimeError) as e:
+        logger.error(f"Export failed: {e}")
+        return 1
+
+    if state_path and committed:
+        save_state(state_path, state)
+    logger.info(f"Exported {totals['rows']:,} rows for {totals['dates']} dates "
+                f"({totals['skipped']} unchanged) in {totals['seconds']:.2f}s "
+                f"({totals['rows'] / max(totals['seconds'], 1e-6):,.0f} rows/s)")
+    # Nothing written or skipped means nothing could be read
+    return 0 if totals['dates'] or totals['skipped'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+from collections import Counter
+from typing import Dict, List, Tuple
+
+
+def slot_keys(listings: List[Dict[str, str]]) -> Dict[Tuple[str, str, int], Dict[str, str]]:
+    """
+    Key each listing by its (time, network) slot
+
+    A third element numbers repeated slots, so two listings sharing a time
+    and network stay distinct.
+    """
+    seen = Counter()
+    keyed = {}
+    for listing in listings:
+        slot = (listing['time'], listing['network'])
+        keyed[slot + (seen[slot],)] = listing
+        seen[slot] += 1
+    return keyed
+
+
+def diff_listings(old: List[Dict[str, str]], new: List[Dict[str, str]]) -> Dict[str, List]:
+    """
+    Rows added, removed or changed between two versions of a date
+
+    Listings are matched by (time, network) slot; a slot whose program or
+    movie flag differs is reported as changed.
+
+    Returns:
+        Dict with 'added' and 'removed' listings, and 'changed' entries of
+        the form {'before': listing, 'after': listing}
+    """
+    old_slots = slot_keys(old)
+    new_slots = slot_keys(new)
+
+    added = [listing for key, listing in new_slots.items() if key not in old_slots]
+    removed = [listing for key, listing in old_slots.items() if key not in new_slots]
+    changed = [
+        {'before': old_slots[key], 'after': listing}
+        for key, listing in new_slots.items()
+        if key in old_slots and old_slots[key] != listing
+    ]
+
+    return {'added': added, 'removed': removed, 'changed': changed}
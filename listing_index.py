@@ -0,0 +1,152 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+QUERY_TIME_PATTERN = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([ap])?\.?\s*m?\.?\s*$', re.IGNORECASE)
+
+
+def parse_query_time(value: str) -> int:
+    """
+    Minutes since midnight for a query time
+
+    Accepts 12-hour times ("8 PM", "8:30pm") and 24-hour times ("20:30").
+
+    Raises:
+        ValueError: If the value is not a recognizable time
+    """
+    match = QUERY_TIME_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"Invalid time {value!r}")
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = (match.group(3) or '').lower()
+    if minute > 59:
+        raise ValueError(f"Invalid time {value!r}")
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Invalid time {value!r}")
+        hour = hour % 12 + (12 if meridiem == 'p' else 0)
+    elif hour > 24 or (hour == 24 and minute):
+        raise ValueError(f"Invalid time {value!r}")
+    return hour * 60 + minute
+
+
+class DateIndex:
+    """
+    Lookup indexes over one DateBlock
+
+    Keeps the rows of each network and every timed row sorted by start
+    minute, so network and time-window queries are a dictionary lookup or a
+    binary search instead of a scan of the whole day. Each network's timed
+    rows also form an interval index: a slot runs until the next later
+    start on the same network (the last one until the end of the day).
+    """
+
+    __slots__ = ('block', 'by_network', 'sorted_minutes', 'sorted_rows', 'slots')
+
+    def __init__(self, block):
+        self.block = block
+        self.by_network: Dict[int, array] = {}
+        for row, network_id in enumerate(block.networks):
+            self.by_network.setdefault(network_id, array('I')).append(row)
+
+        # Rows without a parsed time (negative minutes) are left out
+        timed = sorted((minutes, row) for row, minutes in enumerate(block.times) if minutes >= 0)
+        self.sorted_minutes = array('h', (minutes for minutes, _ in timed))
+        self.sorted_rows = array('I', (row for _, row in timed))
+
+        # Network id -> (start minutes, rows), both sorted by start
+        self.slots: Dict[int, Tuple[array, array]] = {}
+        for minutes, row in timed:
+            slots = self.slots.get(block.networks[row])
+            if slots is None:
+                slots = self.slots[block.networks[row]] = (array('h'), array('I'))
+            slots[0].append(minutes)
+            slots[1].append(row)
+
+    def _slice(self, start: int, end: int) -> array:
+        low = bisect_left(self.sorted_minutes, start)
+        high = bisect_left(self.sorted_minutes, end)
+        return self.sorted_rows[low:high]
+
+    def rows_between(self, start: int, end: int) -> Iterable[int]:
+        """Rows starting in [start, end), wrapping past midnight if end <= start"""
+        if end <= start:
+            return self._slice(start, 24 * 60) + self._slice(0, end)
+        return self._slice(start, end)
+
+    def _slot(self, starts: array, rows: array, position: int) -> Tuple[int, int, Optional[int]]:
+        start = starts[position]
+        after = bisect_right(starts, start)
+        return rows[position], start, starts[after] if after < len(starts) else None
+
+    def on_air(self, network_id: int, minute: int) -> Optional[Tuple[int, int, Optional[int]]]:
+        """
+        The slot a network is showing at a minute of the day
+
+        Returns:
+            Tuple of (row, start minute, end minute or None for the day's
+            last slot), or None before the network's first slot
+        """
+        slots = self.slots.get(network_id)
+        if not slots:
+            return None
+        position = bisect_right(slots[0], minute) - 1
+        if position < 0:
+            return None
+        return self._slot(*slots, position)
+
+    def upcoming(self, network_id: int, minute: int) -> Optional[Tuple[int, int, Optional[int]]]:
+        """
+        The first slot a network starts after a minute of the day
+
+        Returns:
+            Tuple of (row, start minute, end minute or None), or None if
+            nothing else starts that day
+        """
+        slots = self.slots.get(network_id)
+        if not slots:
+            return None
+        position = bisect_right(slots[0], minute)
+        if position >= len(slots[0]):
+            return None
+        return self._slot(*slots, position)
+
+    def query(self, network_ids: Optional[List[int]] = None, start: Optional[int] = None,
+              end: Optional[int] = None, movie: Optional[bool] = None) -> List[int]:
+        """
+        Rows matching every given filter, in page order
+
+        Args:
+            network_ids: Only rows on one of these networks
+            start: Only rows starting at or after this minute
+            end: Only rows starting before this minute
+            movie: Only movies (True) or only non-movies (False)
+
+        Returns:
+            Matching row numbers, sorted
+        """
+        block = self.block
+        timed = start is not None or end is not None
+
+        if network_ids is not None:
+            candidates = [row for network_id in network_ids for row in self.by_network.get(network_id, ())]
+            if timed:
+                low = 0 if start is None else start
+                high = 24 * 60 if end is None else end
+                if high > low:
+                    candidates = [row for row in candidates if low <= block.times[row] < high]
+                else:
+                    candidates = [row for row in candidates
+                                  if block.times[row] >= low or 0 <= block.times[row] < high]
+        elif timed:
+            candidates = self.rows_between(0 if start is None else start, 24 * 60 if end is None else end)
+        else:
+            candidates = range(len(block))
+
+        if movie is not None:
+            flag = 1 if movie else 0
+            candidates = [row for row in candidates if block.movies[row] == flag]
+
+        return sorted(candidates)
+
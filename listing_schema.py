@@ -0,0 +1,169 @@
+import logging
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # pragma: no cover - Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+logger = logging.getLogger(__name__)
+
+# Time zone the site's listing times are given in
+DEFAULT_TIMEZONE = 'America/New_York'
+
+TIME_PATTERN = re.compile(r'^(\d{1,2}):(\d{2}) ([AP]M)$')
+
+# Marks a time that is kept as its original string
+RAW_TIME = -1
+
+MOVIE_MARKER = '[MOVIE]'
+
+# 'Series: "Episode title"'
+EPISODE_PATTERN = re.compile(r'^(.+?):\s*"(.*)"$')
+
+
+def parse_time(time_string: str) -> int:
+    """
+    Minutes since midnight for a listing time like "8:30 PM"
+
+    Returns:
+        Minutes since midnight, or RAW_TIME if the string is not in that form
+    """
+    match = TIME_PATTERN.match(time_string)
+    if not match:
+        return RAW_TIME
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if not 1 <= hour <= 12 or minute > 59:
+        return RAW_TIME
+    return (hour % 12 + (12 if meridiem == 'PM' else 0)) * 60 + minute
+
+
+def format_time(minutes: int) -> str:
+    """Listing time string for minutes since midnight"""
+    hour, minute = divmod(minutes, 60)
+    return f"{hour % 12 or 12}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"
+
+
+@lru_cache(maxsize=1024)
+def network_id(network: str) -> str:
+    """Canonical id of a network name: lowercase words joined by dashes ("A&E" -> "a-and-e")"""
+    slug = re.sub(r'[^a-z0-9]+', '-', network.lower().replace('&', ' and ')).strip('-')
+    return slug or 'unknown'
+
+
+@lru_cache(maxsize=8192)
+def split_program(program: str) -> Tuple[str, Optional[str]]:
+    """
+    Clean title and episode title of a program string
+
+    'Nature: "Episode 12"' gives ('Nature', 'Episode 12') and
+    'Casablanca [MOVIE]' gives ('Casablanca', None).
+    """
+    text = ' '.join(program.replace(MOVIE_MARKER, ' ').split())
+    match = EPISODE_PATTERN.match(text)
+    if match:
+        return match.group(1).strip(), match.group(2).strip() or None
+    return text, None
+
+
+class ListingNormalizer:
+    """
+    Adds typed fields to the scraper's listing dicts, once per scrape
+
+    Each listing keeps its original ``time``, ``network``, ``program``,
+    ``date`` and ``is_movie`` and gains:
+
+    - ``start``: ISO 8601 start with the UTC offset of ``timezone``
+    - ``minutes``: minutes since midnight
+    - ``network_id``: canonical network id (see ``network_id``)
+    - ``title`` and ``episode``: the program split and cleaned
+
+    ``start`` and ``minutes`` are None for a time that cannot be read. The
+    page's date header has no year; the year is the one that puts the date
+    closest to today (preferring one whose weekday matches the header).
+    """
+
+    def __init__(self, timezone: str = DEFAULT_TIMEZONE):
+        self.timezone = timezone
+
+    @property
+    def timezone(self) -> str:
+        return self._timezone
+
+    @timezone.setter
+    def timezone(self, name: str):
+        self._timezone = name
+        self.tz = None
+        if ZoneInfo is None:
+            logger.warning("zoneinfo is not available, using the server's local time")
+            return
+        try:
+            self.tz = ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Unknown time zone {name!r}, using the server's local time")
+
+    def now(self) -> datetime:
+        """Current time in the listings' time zone"""
+        return datetime.now(self.tz) if self.tz else datetime.now().astimezone()
+
+    def page_date(self, header: str, today: date = None) -> Optional[date]:
+        """
+        Calendar date of a date header like "Saturday, July 12"
+
+        Returns:
+            The date, or None if the header is not in that form
+        """
+        today = today or self.now().date()
+        weekday = header.split(',', 1)[0].strip().lower()
+        candidates = []
+        for year in (today.year - 1, today.year, today.year + 1):
+            try:
+                day = datetime.strptime(f'{header.strip()}, {year}', '%A, %B %d, %Y').date()
+            except ValueError:
+                continue
+            candidates.append((day.strftime('%A').lower() != weekday, abs((day - today).days), day))
+        return min(candidates)[2] if candidates else None
+
+    def start(self, day: Optional[date], minutes: int) -> Optional[str]:
+        """ISO 8601 start for minutes past midnight on a day, None if either is unknown"""
+        if day is None or minutes is None or minutes < 0:
+            return None
+        local = datetime(day.year, day.month, day.day) + timedelta(minutes=minutes)
+        if self.tz:
+            return local.replace(tzinfo=self.tz).isoformat()
+        return local.astimezone().isoformat()
+
+    def normalize(self, listings: List[Dict], today: date = None) -> List[Dict]:
+        """
+        Add the normalized fields to listing dicts in place
+
+        Listings that already have them (e.g. read back from a snapshot) are
+        left alone.
+
+        Returns:
+            The same list
+        """
+        days: Dict[str, Optional[date]] = {}
+        for listing in listings:
+            if 'network_id' in listing:
+                continue
+            header = listing['date']
+            if header not in days:
+                days[header] = self.page_date(header, today)
+            minutes = parse_time(listing['time'])
+            minutes = None if minutes == RAW_TIME else minutes
+            title, episode = split_program(listing['program'])
+            listing['start'] = self.start(days[header], minutes)
+            listing['minutes'] = minutes
+            listing['network_id'] = network_id(listing['network'])
+            listing['title'] = title
+            listing['episode'] = episode
+        return listings
+
+
+# Normalizer shared by every scraper in the process
+listing_normalizer = ListingNormalizer()
@@ -0,0 +1,199 @@
+import logging
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from listing_index import DateIndex
+from listing_schema import RAW_TIME, format_time, listing_normalizer, parse_time, split_program
+from listing_schema import network_id as canonical_network_id
+
+logger = logging.getLogger(__name__)
+
+
+def date_of(start: str) -> datetime.date:
+    """Calendar date of an ISO 8601 start"""
+    return datetime.date.fromisoformat(start[:10])
+
+
+class DateBlock:
+    """Column arrays holding one date's listings"""
+
+    __slots__ = ('date', 'day', 'times', 'networks', 'programs', 'movies', 'raw_times', 'index')
+
+    def __init__(self, date: str):
+        self.date = date
+        self.day: Optional[datetime.date] = None
+        self.times = array('h')
+        self.networks = array('H')
+        self.programs: List[str] = []
+        self.movies = bytearray()
+        self.raw_times: Dict[int, str] = {}
+        self.index: Optional[DateIndex] = None
+
+    def __len__(self):
+        return len(self.programs)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this block (shared network names excluded)"""
+        return (sys.getsizeof(self) + sys.getsizeof(self.times) + sys.getsizeof(self.networks)
+                + sys.getsizeof(self.programs) + sys.getsizeof(self.movies)
+                + sys.getsizeof(self.raw_times)
+                + sum(sys.getsizeof(program) for program in self.programs))
+
+
+class ListingStore:
+    """
+    Compact in-memory store for long listing history
+
+    Each date is kept as column arrays: times as minutes since midnight,
+    networks as indexes into a shared table, and interned program titles.
+    Rows are materialized back into the scraper's listing dicts (normalized
+    fields included) on demand, so the JSON shape is unchanged. The oldest
+    dates are dropped once more than
+    ``max_dates`` are held.
+
+    Listeners added with ``add_listener`` see every date stored or dropped,
+    so secondary indexes can follow the store incrementally.
+    """
+
+    def __init__(self, max_dates: int = 60):
+        self.max_dates = max_dates
+        self._blocks: 'OrderedDict[str, DateBlock]' = OrderedDict()
+        self._network_names: List[str] = []
+        self._network_slugs: List[str] = []
+        self._network_ids: Dict[str, int] = {}
+        self._listeners: List[Callable[[str, Optional[DateBlock]], None]] = []
+        self._lock = threading.Lock()
+
+    def _network_id(self, network: str) -> int:
+        network_id = self._network_ids.get(network)
+        if network_id is None:
+            network_id = self._network_ids[network] = len(self._network_names)
+            self._network_names.append(sys.intern(network))
+            self._network_slugs.append(canonical_network_id(network))
+        return network_id
+
+    def add_listener(self, listener: Callable[[str, Optional[DateBlock]], None]):
+        """Call ``listener(date, block)`` when a date is stored, with a None block when it is dropped"""
+        self._listeners.append(listener)
+
+    def _notify(self, changes: List[tuple]):
+        for date, block in changes:
+            for listener in self._listeners:
+                try:
+                    listener(date, block)
+                except Exception as e:
+                    logger.error(f"History listener failed for {date}: {e}")
+
+    def add(self, date: str, listings: List[Dict[str, str]]):
+        """
+        Store (or replace) the listings for a date
+
+        Args:
+            date: Date string the listings belong to
+            listings: Listing dicts as produced by the scraper
+        """
+        # Rows carry the page's date header, which the JSON keeps as is
+        block = DateBlock(sys.intern(listings[0]['date'] if listings else date))
+        start = listings[0].get('start') if listings else None
+        block.day = date_of(start) if start else listing_normalizer.page_date(block.date)
+        with self._lock:
+            for listing in listings:
+                minutes = listing['minutes'] if 'minutes' in listing else parse_time(listing['time'])
+                if minutes is None or minutes == RAW_TIME or format_time(minutes) != listing['time']:
+                    block.raw_times[len(block.programs)] = sys.intern(listing['time'])
+                    minutes = RAW_TIME
+                block.times.append(minutes)
+                block.networks.append(self._network_id(listing['network']))
+                block.programs.append(sys.intern(listing['program']))
+                block.movies.append(1 if listing['is_movie'] else 0)
+
+            block.index = DateIndex(block)
+            self._blocks[date] = block
+            self._blocks.move_to_end(date)
+            changes = [(date, block)]
+            while len(self._blocks) > self.max_dates:
+                changes.append((self._blocks.popitem(last=False)[0], None))
+        self._notify(changes)
+
+    def remove(self, date: str):
+        """Drop a date from the store"""
+        with self._lock:
+            removed = self._blocks.pop(date, None) is not None
+        if removed:
+            self._notify([(date, None)])
+
+    def dates(self) -> List[str]:
+        """Stored dates, oldest first"""
+        with self._lock:
+            return list(self._blocks)
+
+    def block(self, date: str) -> Optional[DateBlock]:
+        """The column block for a date, if stored"""
+        with self._lock:
+            return self._blocks.get(date)
+
+    def network_name(self, network_id: int) -> str:
+        return self._network_names[network_id]
+
+    def network_ids(self, names: Iterable[str]) -> List[int]:
+        """Ids of the named networks, matched case-insensitively"""
+        wanted = {name.strip().lower() for name in names}
+        return [network_id for network_id, name in enumerate(self._network_names) if name.lower() in wanted]
+
+    def rows(self, block: DateBlock, rows: Iterable[int]) -> Iterator[Dict[str, str]]:
+        """Yield the given rows of a block as scraper-shaped dicts"""
+        names = self._network_names
+        slugs = self._network_slugs
+        for row in rows:
+            minutes = block.times[row]
+            if minutes == RAW_TIME:
+                time_string = block.raw_times[row]
+                minutes = parse_time(time_string)
+            else:
+                time_string = format_time(minutes)
+            if minutes == RAW_TIME:
+                minutes = None
+            program = block.programs[row]
+            title, episode = split_program(program)
+            yield {
+                'time': time_string,
+                'network': names[block.networks[row]],
+                'program': program,
+                'date': block.date,
+                'is_movie': bool(block.movies[row]),
+                'start': listing_normalizer.start(block.day, minutes),
+                'minutes': minutes,
+                'network_id': slugs[block.networks[row]],
+                'title': title,
+                'episode': episode
+            }
+
+    def iter_listings(self, date: str) -> Iterator[Dict[str, str]]:
+        """Yield a date's listings as scraper-shaped dicts"""
+        block = self.block(date)
+        if block is None:
+            return
+        yield from self.rows(block, range(len(block)))
+
+    def listings(self, date: str) -> List[Dict[str, str]]:
+        """A date's listings as scraper-shaped dicts"""
+        return list(self.iter_listings(date))
+
+    def stats(self) -> Dict:
+        """Size of the store for the status endpoint"""
+        with self._lock:
+            blocks = list(self._blocks.values())
+        rows = sum(len(block) for block in blocks)
+        nbytes = sum(block.nbytes() for block in blocks)
+        return {
+            'dates': len(blocks),
+            'max_dates': self.max_dates,
+            'listings': rows,
+            'networks': len(self._network_names),
+            'bytes': nbytes,
+            'bytes_per_listing': round(nbytes / rows, 1) if rows else 0
+        }
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover - lxml is in requirements.txt
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+LXML_AVAILABLE = etree is not None
+
+# Attribute that marks the drupalSettings script tag
+SETTINGS_MARKER = b'data-drupal-selector="drupal-settings-json"'
+
+# Bytes read from the upstream response per parser feed
+STREAM_CHUNK_SIZE = 16384
+
+
+def _text(element) -> str:
+    """All descendant text of an element, like BeautifulSoup's ``.text``"""
+    return ''.join(element.itertext())
+
+
+def _classes(element) -> List[str]:
+    return (element.get('class') or '').split()
+
+
+def metadata_from_settings(drupal_settings: Dict) -> Dict:
+    """Build the scraper's metadata dict from parsed drupalSettings"""
+    metadata = {
+        'networks': [],
+        'dates': [],
+        'current_date': 'Unknown Date'
+    }
+
+    if 'tvListings' in drupal_settings:
+        tv_settings = drupal_settings['tvListings']
+        metadata['networks'] = tv_settings.get('networks', [])
+        metadata['dates'] = tv_settings.get('dates', [])
+        metadata['current_date'] = tv_settings.get('currentDate', 'Unknown Date')
+
+    return metadata
+
+
+class ListingsPageParser:
+    """
+    Single-pass parser for a tv-listings page
+
+    Feeds the page through lxml's pull parser once and picks out the
+    drupalSettings script, the first ``h3.date-header`` and the rows of the
+    ``#daily-schedule`` table body. Elements are discarded as soon as they
+    close, so no tree of the whole page is ever held in memory. For well-formed
+    pages the output matches ``TVListingsScraper.extract_table_data`` and
+    ``extract_metadata``; lxml recovers from unclosed cells the way browsers
+    do, where html.parser nests them.
+
+    Pages may be fed in chunks as they download. Bytes are decoded with
+    ``encoding`` when given (otherwise lxml reads the page's meta charset),
+    and ``on_row`` is called with each listing as soon as its ``tr`` closes.
+    Rows seen before the date header carry the date known at that point.
+    """
+
+    def __init__(self, encoding: Optional[str] = None, on_row: Optional[Callable[[Dict], None]] = None):
+        if not LXML_AVAILABLE:
+            raise RuntimeError("lxml is required for the single-pass parser")
+        self._parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+        self.on_row = on_row
+        self.drupal_settings = None
+        self.date_header = None
+        self.rows: List[Tuple[str, str, str, bool]] = []
+        self.table_found = False
+        self._in_table = False
+        self._table_depth = 0
+        self._tbody_seen = False
+        self._in_tbody = False
+        self._collecting = 0
+
+    def feed(self, data):
+        """Feed the next chunk of the page (str or bytes)"""
+        self._parser.feed(data)
+        self._drain()
+
+    def close(self):
+        """Finish the page and process any remaining events"""
+        self._parser.close()
+        self._drain()
+
+    def _drain(self):
+        for event, element in self._parser.read_events():
+            tag = element.tag
+            if event == 'start':
+                self._start(tag, element)
+            else:
+                self._end(tag, element)
+
+    def _start(self, tag, element):
+        if tag == 'table':
+            if self._in_table:
+                self._table_depth += 1
+            elif not self.table_found and element.get('id') == 'daily-schedule':
+                self.table_found = True
+                self._in_table = True
+        elif tag == 'tbody' and self._in_table and not self._tbody_seen:
+            self._tbody_seen = True
+            self._in_tbody = True
+        elif (tag == 'tr' and self._in_tbody) or (
+                tag == 'h3' and self.date_header is None and 'date-header' in _classes(element)):
+            self._collecting += 1
+
+    def _end(self, tag, element):
+        if tag == 'tr' and self._in_tbody:
+            self._collecting -= 1
+            cells = list(element.iter('td'))
+            if len(cells) >= 3:
+                program = _text(cells[2])
+                row = (_text(cells[0]).strip(), _text(cells[1]).strip(), program.strip(), '[MOVIE]' in program)
+                self.rows.append(row)
+                if self.on_row:
+                    self.on_row(self._listing(row, self.date_header))
+        elif tag == 'h3' and self.date_header is None and 'date-header' in _classes(element):
+            self._collecting -= 1
+            self.date_header = _text(element).strip()
+        elif tag == 'script' and self.drupal_settings is None \
+                and element.get('data-drupal-selector') == 'drupal-settings-json':
+            self.drupal_settings = element.text or ''
+        elif tag == 'tbody' and self._in_tbody and not self._table_depth:
+            self._in_tbody = False
+        elif tag == 'table' and self._in_table:
+            if self._table_depth:
+                self._table_depth -= 1
+            else:
+                self._in_table = False
+
+        # Anything outside a row or header being collected is no longer needed
+        if not self._collecting:
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    def settings(self) -> Dict:
+        """Parsed drupalSettings, or an empty dict"""
+        if self.drupal_settings is None:
+            logger.warning("Could not find drupalSettings in the page")
+            return {}
+        try:
+            return json.loads(self.drupal_settings.strip())
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse drupalSettings JSON: {e}")
+            return {}
+
+    def metadata(self) -> Dict:
+        """Metadata dict built from drupalSettings"""
+        return metadata_from_settings(self.settings())
+
+    def listings(self) -> List[Dict[str, str]]:
+        """Listings from the daily-schedule table"""
+        if not self.table_found:
+            logger.warning("Could not find daily-schedule table")
+            return []
+        return [self._listing(row, self.date_header) for row in self.rows]
+
+    @staticmethod
+    def _listing(row: Tuple[str, str, str, bool], date_header: Optional[str]) -> Dict:
+        time, network, program, is_movie = row
+        return {
+            'time': time,
+            'network': network,
+            'program': program,
+            'date': date_header if date_header is not None else "Unknown Date",
+            'is_movie': is_movie
+        }
+
+
+def parse_listings_page(html_content: str) -> Tuple[List[Dict[str, str]], Dict]:
+    """
+    Parse listings and metadata from a tv-listings page in one pass
+
+    Args:
+        html_content: The HTML content of the page
+
+    Returns:
+        Tuple of (listings, metadata)
+    """
+    parser = ListingsPageParser()
+    parser.feed(html_content)
+    parser.close()
+    return parser.listings(), parser.metadata()
+
+
+class ListingsPageStream:
+    """
+    Hashes and parses a listings page chunk by chunk as it downloads
+
+    Nothing but the current chunk and the parser's state is held, so the
+    raw body and its decoded text never exist in full and memory stays flat
+    however large the page is.
+    """
+
+    def __init__(self, encoding: Optional[str] = None, on_row: Optional[Callable[[Dict], None]] = None):
+        self.parser = ListingsPageParser(encoding=encoding, on_row=on_row)
+        self._hash = hashlib.sha1()
+        self.bytes_read = 0
+
+    def feed(self, chunk: bytes):
+        """Hash and parse the next chunk of the body"""
+        self.bytes_read += len(chunk)
+        self._hash.update(chunk)
+        self.parser.feed(chunk)
+
+    def close(self) -> Tuple[List[Dict[str, str]], Dict, str]:
+        """
+        Finish the page
+
+        Returns:
+            Tuple of (listings, metadata, SHA-1 hex digest of the body)
+        """
+        self.parser.close()
+        return self.parser.listings(), self.parser.metadata(), self._hash.hexdigest()
+
+
+def parse_listings_chunks(chunks: Iterable[bytes], encoding: Optional[str] = None) -> Tuple[List[Dict[str, str]], Dict, str]:
+    """
+    Parse a tv-listings page from an iterable of byte chunks
+
+    Args:
+        chunks: The page body, e.g. ``response.iter_content(STREAM_CHUNK_SIZE)``
+        encoding: Charset of the body, None to let lxml detect it
+
+    Returns:
+        Tuple of (listings, metadata, body hash)
+    """
+    stream = ListingsPageStream(encoding=encoding)
+    for chunk in chunks:
+        stream.feed(chunk)
+    return stream.close()
+
+
+class DrupalSettingsScanner:
+    """
+    Finds the drupalSettings JSON in a page fed as byte chunks
+
+    No HTML is parsed: the raw bytes are searched for the settings script
+    tag and only its contents are kept, so a caller streaming the page can
+    stop reading as soon as ``feed`` returns True. Matches
+    ``TVListingsScraper.extract_drupal_settings``.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._found = False
+        self._settings_json: bytes = None
+        self.bytes_read = 0
+
+    @property
+    def done(self) -> bool:
+        return self._settings_json is not None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Scan the next chunk; returns True once the settings have been read"""
+        if self.done:
+            return True
+        self.bytes_read += len(chunk)
+        buffer = self._buffer + chunk
+        if not self._found:
+            index = buffer.find(SETTINGS_MARKER)
+            if index < 0:
+                # Keep just enough to catch a marker split across chunks
+                self._buffer = buffer[-(len(SETTINGS_MARKER) - 1):]
+                return False
+            self._found = True
+            buffer = buffer[index + len(SETTINGS_MARKER):]
+
+        self._buffer = buffer
+        tag_end = buffer.find(b'>')
+        if tag_end >= 0:
+            content_end = buffer.find(b'<', tag_end)
+            if content_end >= 0:
+                self._settings_json = buffer[tag_end + 1:content_end]
+                self._buffer = b''
+        return self.done
+
+    def settings(self) -> Dict:
+        """Parsed drupalSettings, or an empty dict"""
+        if not self.done:
+            logger.warning("Could not find drupalSettings in the page")
+            return {}
+        try:
+            return json.loads(self._settings_json.decode('utf-8', errors='replace').strip())
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse drupalSettings JSON: {e}")
+            return {}
+
+    def metadata(self) -> Dict:
+        """Metadata dict built from drupalSettings"""
+        return metadata_from_settings(self.settings())
@@ -0,0 +1,167 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from cache import CacheEntry, ListingsCache, TODAY_KEY, content_hash
+from listing_schema import listing_normalizer
+from scraper import TVListingsScraper
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchScheduler:
+    """
+    Background thread that keeps every upstream date warm in a ListingsCache
+
+    Each cycle fetches today's page, reads the date list from its metadata and
+    then refreshes every other date. Results whose content hash is unchanged
+    only have their cache timestamp renewed. Cycles run every ``interval``
+    seconds (plus or minus ``jitter`` as a fraction of it) and always shortly
+    after local midnight, when the site's day window rotates.
+    """
+
+    def __init__(self, cache: ListingsCache, interval: float = 600, jitter: float = 0.1,
+                 scraper_factory: Callable[[], TVListingsScraper] = TVListingsScraper):
+        self.cache = cache
+        self.interval = interval
+        self.jitter = jitter
+        self.scraper_factory = scraper_factory
+        self._hashes: Dict[str, str] = {}
+        self._date_stats: Dict[str, Dict] = {}
+        self._dates: List[str] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.cycles = 0
+        self.last_cycle: Optional[str] = None
+        self.last_cycle_duration: Optional[float] = None
+
+    def start(self):
+        """Start the scheduler thread if it is not already running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            self._thread.start()
+        logger.info(f"Prefetch scheduler started (interval {self.interval}s)")
+
+    def stop(self):
+        """Ask the scheduler thread to exit after the current cycle"""
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        """Whether the scheduler thread is alive and has not been asked to stop"""
+        return bool(self._thread and self._thread.is_alive() and not self._stop.is_set())
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_all()
+            except Exception as e:
+                logger.error(f"Prefetch cycle failed: {e}")
+            self._stop.wait(self._next_delay())
+
+    def _next_delay(self, now: datetime = None) -> float:
+        """Seconds until the next cycle: jittered interval, capped at just past midnight in LISTINGS_TZ"""
+        now = now or listing_normalizer.now()
+        delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        # Via timestamps, so a DST change in between is counted
+        until_rotation = midnight.timestamp() - now.timestamp() + random.uniform(5, 60)
+        return max(1.0, min(delay, until_rotation))
+
+    def refresh_all(self):
+        """Refresh today's page and every other available date once"""
+        started = time.monotonic()
+        scraper = self.scraper_factory()
+
+        listings, metadata = self._refresh(TODAY_KEY, scraper.scrape_daily_schedule)
+        dates = metadata.get('dates', []) if listings else []
+        if not dates:
+            logger.warning("Prefetch could not read the available dates")
+            return
+
+        # The default page is also requested by its date string
+        self._store(dates[0], listings, metadata)
+        self._rotate(dates)
+
+        for date_string in dates[1:]:
+            if self._stop.is_set():
+                break
+            self._refresh(date_string, lambda: scraper.scrape_by_date(date_string=date_string))
+
+        self.cycles += 1
+        self.last_cycle = datetime.now().isoformat()
+        self.last_cycle_duration = round(time.monotonic() - started, 3)
+        logger.info(f"Prefetched {len(dates)} dates in {self.last_cycle_duration}s")
+
+    def _refresh(self, key: str, loader: Callable):
+        started = time.monotonic()
+        # Joins a user request already fetching the same date
+        result = self.cache.flight.do(key, loader)
+        if isinstance(result, CacheEntry):
+            # The request's cache load hands back its stored entry
+            result = result.listings, result.metadata
+        listings, metadata = result
+        duration = round(time.monotonic() - started, 3)
+
+        changed = self._store(key, listings, metadata) if listings else None
+        with self._lock:
+            stats = self._date_stats.setdefault(key, {'refreshes': 0, 'unchanged': 0, 'failures': 0})
+            stats['last_refresh'] = datetime.now().isoformat()
+            stats['duration'] = duration
+            if changed is None:
+                stats['failures'] += 1
+                logger.warning(f"Prefetch returned no listings for {key}")
+            else:
+                stats['refreshes'] += 1
+                if not changed:
+                    stats['unchanged'] += 1
+        return listings, metadata
+
+    def _store(self, key: str, listings: List[Dict[str, str]], metadata: Dict) -> bool:
+        """Cache a result unless its hash matches; returns True if it changed"""
+        digest = content_hash(listings, metadata)
+        if self._hashes.get(key) == digest and self.cache.touch(key):
+            return False
+        self._hashes[key] = digest
+        self.cache.put(key, listings, metadata)
+        return True
+
+    def _rotate(self, dates: List[str]):
+        """Drop dates that have fallen out of the site's window"""
+        if dates == self._dates:
+            return
+        current = set(dates)
+        for key in self.cache.keys():
+            if key != TODAY_KEY and key not in current:
+                logger.info(f"Date {key} rotated out of the upstream window")
+                self.cache.invalidate(key)
+                self._hashes.pop(key, None)
+        with self._lock:
+            for key in list(self._date_stats):
+                if key != TODAY_KEY and key not in current:
+                    del self._date_stats[key]
+        self._dates = list(dates)
+
+    def available_dates(self) -> List[str]:
+        """Dates seen in the most recent cycle"""
+        return list(self._dates)
+
+    def stats(self) -> Dict:
+        """Per-date refresh times and durations for the status endpoint"""
+        with self._lock:
+            return {
+                'running': bool(self._thread and self._thread.is_alive()),
+                'interval': self.interval,
+                'cycles': self.cycles,
+                'last_cycle': self.last_cycle,
+                'last_cycle_duration': self.last_cycle_duration,
+                'dates': {key: dict(stats) for key, stats in self._date_stats.items()}
+            }
+
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from metrics import registry
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+queue_wait_seconds = registry.histogram(
+    'adp_upstream_queue_wait_seconds', 'Time upstream requests waited for the rate limiter', ['host', 'queue']
+)
+rate_limited_total = registry.counter(
+    'adp_upstream_rate_limited_total', 'Upstream requests refused by the rate limiter', ['host', 'queue']
+)
+
+BUCKET_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    host TEXT PRIMARY KEY,
+    next_at REAL NOT NULL
+)
+"""
+
+
+class RateLimitedError(Exception):
+    """Raised instead of waiting longer for the upstream rate limiter than allowed"""
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc or url
+
+
+class TokenBucket:
+    """
+    Token bucket per host, kept as the time the next token is due
+
+    A request reserves a token and is told how long to wait for it, so
+    waiters are served in order without polling. Up to ``burst`` requests go
+    through at once after an idle spell.
+    """
+
+    def __init__(self):
+        self._next_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _schedule(next_at: Optional[float], now: float, rate: float, burst: int,
+                  max_wait: float) -> Tuple[Optional[float], Optional[float]]:
+        """(seconds to wait, new next_at), or (None, None) if the wait would exceed max_wait"""
+        interval = 1 / rate
+        next_at = now if next_at is None else max(next_at, now)
+        wait = max(0.0, next_at - (max(1, burst) - 1) * interval - now)
+        if wait > max_wait:
+            return None, None
+        return wait, next_at + interval
+
+    def reserve(self, host: str, rate: float, burst: int, max_wait: float) -> Optional[float]:
+        """
+        Reserve the next token for a host
+
+        Returns:
+            Seconds until the token is due, or None (and nothing reserved)
+            if that is more than ``max_wait``
+        """
+        with self._lock:
+            wait, next_at = self._schedule(self._next_at.get(host), time.time(), rate, burst, max_wait)
+            if wait is not None:
+                self._next_at[host] = next_at
+            return wait
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket kept in a SQLite file, so every process using the file shares it"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        connection = self._connect()
+        try:
+            connection.execute(BUCKET_SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit, so the reservation can take the write lock up front
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def reserve(self, host: str, rate: float, burst: int, max_wait: float) -> Optional[float]:
+        try:
+            return self._reserve_shared(host, rate, burst, max_wait)
+        except sqlite3.Error as e:
+            # Limit this process on its own rather than fail the request
+            logger.warning(f"Shared rate limit unavailable, using the local bucket: {e}")
+            return super().reserve(host, rate, burst, max_wait)
+
+    def _reserve_shared(self, host: str, rate: float, burst: int, max_wait: float) -> Optional[float]:
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT next_at FROM rate_buckets WHERE host = ?', (host,)).fetchone()
+                wait, next_at = self._schedule(row[0] if row else None, time.time(), rate, burst, max_wait)
+                if wait is not None:
+                    connection.execute(
+                        'INSERT INTO rate_buckets VALUES (?, ?) ON CONFLICT(host) DO UPDATE SET next_at = excluded.next_at',
+                        (host, next_at)
+                    )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        finally:
+            connection.close()
+        return wait
+
+
+class HostSlots:
+    """In-flight requests to one host and the callers queued for a slot"""
+
+    __slots__ = ('active', 'waiters')
+
+    def __init__(self):
+        self.active = 0
+        self.waiters: deque = deque()
+
+
+class RateLimiter:
+    """
+    Request rate and concurrency limits for every call to the upstream site
+
+    Each attempt takes a token from a bucket refilled at ``rate`` per second
+    per host (``burst`` may be spent at once), and each fetch holds one of
+    ``max_concurrency`` slots per host while it downloads. Both are shared by
+    every scraper and thread in the process; with ``shared_path`` set the
+    token bucket lives in that SQLite file and is shared by every process
+    using it too.
+
+    A caller waits its turn, but never past its fetch deadline or
+    ``max_wait`` seconds. With ``fail_fast`` (globally or per call) it
+    raises RateLimitedError at once instead of waiting. Time spent queued is
+    recorded in ``adp_upstream_queue_wait_seconds`` and in ``stats``.
+    A ``rate`` or ``max_concurrency`` of 0 turns that limit off.
+    """
+
+    def __init__(self, rate: float = 5, burst: int = 10, max_concurrency: int = 8,
+                 max_wait: Optional[float] = None, fail_fast: bool = False, shared_path: Optional[str] = None):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.fail_fast = fail_fast
+        self.shared_path = shared_path
+        self._slots: Dict[str, HostSlots] = {}
+        self._lock = threading.Lock()
+        self.waits = LatencyTracker(min_samples=1)
+        self.counters = {'requests': 0, 'queued': 0, 'rejected': 0}
+
+    @property
+    def shared_path(self) -> Optional[str]:
+        return self._shared_path
+
+    @shared_path.setter
+    def shared_path(self, path: Optional[str]):
+        self._shared_path = path
+        self.bucket = SharedTokenBucket(path) if path else TokenBucket()
+
+    def _allowance(self, deadline: Optional[float], fail_fast: Optional[bool]) -> float:
+        """Longest a caller may wait, in seconds"""
+        if self.fail_fast if fail_fast is None else fail_fast:
+            return 0.0
+        allowance = math.inf if deadline is None else max(0.0, deadline - time.monotonic())
+        return allowance if self.max_wait is None else min(allowance, self.max_wait)
+
+    def _reject(self, host: str, queue: str):
+        with self._lock:
+            self.counters['rejected'] += 1
+        rate_limited_total.inc(host=host, queue=queue)
+        raise RateLimitedError(f"Upstream {queue} limit reached for {host}")
+
+    def _waited(self, host: str, queue: str, seconds: float):
+        with self._lock:
+            if queue == 'rate':
+                self.counters['requests'] += 1
+            if seconds:
+                self.counters['queued'] += 1
+        self.waits.observe(seconds)
+        queue_wait_seconds.observe(seconds, host=host, queue=queue)
+
+    def _token(self, host: str, allowance: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        wait = self.bucket.reserve(host, self.rate, self.burst, allowance)
+        if wait is None:
+            self._reject(host, 'rate')
+        return wait
+
+    def _claim(self, host: str) -> Optional[Future]:
+        """Take a slot now (None), or a Future that completes when one is handed over"""
+        with self._lock:
+            slots = self._slots.get(host)
+            if slots is None:
+                slots = self._slots[host] = HostSlots()
+            if (self.max_concurrency <= 0 or slots.active < self.max_concurrency) and not slots.waiters:
+                slots.active += 1
+                return None
+            waiter = Future()
+            slots.waiters.append(waiter)
+            return waiter
+
+    def _release(self, host: str):
+        """Hand the slot to the first caller still queued, or free it"""
+        with self._lock:
+            slots = self._slots[host]
+            while slots.waiters:
+                waiter = slots.waiters.popleft()
+                if waiter.set_running_or_notify_cancel():
+                    waiter.set_result(None)
+                    return
+            slots.active -= 1
+
+    def wait_turn(self, url: str, deadline: Optional[float] = None, fail_fast: Optional[bool] = None):
+        """
+        Block until a request to the URL's host may be sent
+
+        Args:
+            url: URL about to be requested
+            deadline: time.monotonic() value the caller gives up at
+            fail_fast: Override of the limiter's ``fail_fast``
+
+        Raises:
+            RateLimitedError: If the wait would be too long
+        """
+        host = host_of(url)
+        wait = self._token(host, self._allowance(deadline, fail_fast))
+        if wait:
+            time.sleep(wait)
+        self._waited(host, 'rate', wait)
+
+    async def wait_turn_async(self, url: str, deadline: Optional[float] = None, fail_fast: Optional[bool] = None):
+        """``wait_turn`` for coroutines: waits without blocking the event loop"""
+        host = host_of(url)
+        allowance = self._allowance(deadline, fail_fast)
+        if self.shared_path:
+            # The shared bucket's SQLite lock can be held for seconds; wait for it off the loop
+            wait = await asyncio.get_running_loop().run_in_executor(None, self._token, host, allowance)
+        else:
+            wait = self._token(host, allowance)
+        if wait:
+            await asyncio.sleep(wait)
+        self._waited(host, 'rate', wait)
+
+    @contextmanager
+    def slot(self, url: str, deadline: Optional[float] = None, fail_fast: Optional[bool] = None):
+        """
+        Hold one of the host's concurrent request slots for the block
+
+        Raises:
+            RateLimitedError: If no slot frees up in time
+        """
+        host = host_of(url)
+        started = time.monotonic()
+        waiter = self._claim(host)
+        if waiter is not None:
+            allowance = self._allowance(deadline, fail_fast)
+            try:
+                waiter.result(timeout=None if allowance == math.inf else allowance)
+            except FutureTimeoutError:
+                # Unless the slot was handed over in the meantime
+                if waiter.cancel():
+                    self._reject(host, 'concurrency')
+        self._waited(host, 'concurrency', time.monotonic() - started if waiter else 0.0)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    @asynccontextmanager
+    async def slot_async(self, url: str, deadline: Optional[float] = None, fail_fast: Optional[bool] = None):
+        """``slot`` for coroutines: queues without blocking the event loop"""
+        host = host_of(url)
+        started = time.monotonic()
+        waiter = self._claim(host)
+        if waiter is not None:
+            allowance = self._allowance(deadline, fail_fast)
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)),
+                                       None if allowance == math.inf else allowance)
+            except asyncio.TimeoutError:
+                if waiter.cancel():
+                    self._reject(host, 'concurrency')
+            except asyncio.CancelledError:
+                if not waiter.cancel():
+                    self._release(host)
+                raise
+        self._waited(host, 'concurrency', time.monotonic() - started if waiter else 0.0)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def stats(self) -> Dict:
+        """Limits, queue lengths and recent wait times for the status endpoint"""
+        with self._lock:
+            stats = dict(self.counters)
+            hosts = {
+                host: {'in_flight': slots.active, 'queued': sum(1 for waiter in slots.waiters if not waiter.cancelled())}
+                for host, slots in self._slots.items()
+            }
+        p95 = self.waits.percentile(0.95)
+        stats.update({
+            'rate': self.rate,
+            'burst': self.burst,
+            'max_concurrency': self.max_concurrency,
+            'fail_fast': self.fail_fast,
+            'shared': self.shared_path,
+            'hosts': hosts,
+            'wait_p95': round(p95, 3) if p95 is not None else None
+        })
+        return stats
+
+
+# Limiter shared by every scraper in the process
+upstream_limiter = RateLimiter()
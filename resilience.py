@@ -0,0 +1,218 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+upstream_events_total = registry.counter(
+    'adp_upstream_events_total', 'Retries, hedged requests and circuit breaker decisions', ['event']
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream the circuit breaker has cut off"""
+
+
+class BudgetExceededError(TimeoutError):
+    """Raised when an upstream fetch runs out of its latency budget"""
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when upstream gave no data and there is no earlier data to serve"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls are refused for ``reset_timeout`` seconds. Then one probe call is
+    let through (half open): success closes the circuit, failure opens it
+    again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        upstream_events_total.inc(event='breaker_rejected')
+        raise CircuitOpenError(f"Upstream circuit is {self.state}")
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Upstream circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    logger.warning(f"Upstream circuit opened after {self.failures} failures")
+                    upstream_events_total.inc(event='breaker_opened')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'reset_timeout': self.reset_timeout
+            }
+
+
+class LatencyTracker:
+    """Rolling window of recent upstream response times"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """The given percentile (0-1) of the window, or None with too few samples"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class UpstreamPolicy:
+    """
+    How the scrapers call the upstream site
+
+    Each page fetch gets ``budget`` seconds in total. Attempts time out after
+    ``attempt_timeout`` seconds (or whatever is left of the budget). Failed
+    attempts (connection errors, timeouts, 5xx) are retried up to
+    ``retries`` times with full-jitter exponential backoff while the budget
+    lasts. With ``hedge`` set, the async scraper sends a second request when
+    the first is slower than the recent ``hedge_percentile`` latency and
+    uses whichever answers first. Every outcome feeds a shared circuit
+    breaker.
+    """
+
+    def __init__(self, budget: float = 10, attempt_timeout: float = 8, retries: int = 2,
+                 backoff_base: float = 0.25, backoff_cap: float = 2, hedge: bool = True,
+                 hedge_percentile: float = 0.95, breaker: CircuitBreaker = None,
+                 latency: LatencyTracker = None):
+        self.budget = budget
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = latency or LatencyTracker()
+        self.counters = {'retries': 0, 'hedges': 0, 'hedge_wins': 0, 'budget_exhausted': 0}
+        self._lock = threading.Lock()
+
+    def deadline(self) -> float:
+        """time.monotonic() value at which a fetch starting now must give up"""
+        return time.monotonic() + self.budget
+
+    def attempt_timeout_for(self, deadline: float) -> float:
+        """Timeout for the next attempt, raising BudgetExceededError if none is left"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.count('budget_exhausted')
+            raise BudgetExceededError(f"Upstream latency budget of {self.budget}s exhausted")
+        return min(self.attempt_timeout, remaining)
+
+    def backoff(self, attempt: int, deadline: float) -> Optional[float]:
+        """
+        Jittered delay before retry number ``attempt`` (1-based)
+
+        Returns:
+            Seconds to wait, or None if no retry is left or it would not
+            fit in the budget
+        """
+        if attempt > self.retries:
+            return None
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+        if time.monotonic() + delay >= deadline:
+            self.count('budget_exhausted')
+            return None
+        self.count('retries')
+        return delay
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which to send a hedged request, None if not hedging"""
+        if not self.hedge or self.breaker.state != CircuitBreaker.CLOSED:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def record_success(self, seconds: float):
+        self.latency.observe(seconds)
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.breaker.record_failure()
+
+    def count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+        upstream_events_total.inc(event=counter)
+
+    def stats(self) -> Dict:
+        """Counters, breaker state and recent latency for the status endpoint"""
+        with self._lock:
+            stats = dict(self.counters)
+        p95 = self.latency.percentile(0.95)
+        stats.update({
+            'budget': self.budget,
+            'attempt_timeout': self.attempt_timeout,
+            'max_retries': self.retries,
+            'hedge': self.hedge,
+            'latency_p95': round(p95, 3) if p95 is not None else None,
+            'breaker': self.breaker.stats()
+        })
+        return stats
+
+
+# Policy shared by every scraper in the process
+upstream_policy = UpstreamPolicy()
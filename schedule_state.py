@@ -0,0 +1,84 @@
+import threading
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from cache import CacheEntry
+
+
+class ScheduleSnapshot(NamedTuple):
+    """
+    One published version of a date's schedule
+
+    Immutable; the listing dicts are shared with the cache and must not be
+    modified either. ``version`` is the cache's content version, so it only
+    changes when the listings or metadata do.
+    """
+
+    version: int
+    key: str
+    listings: Tuple[Dict[str, str], ...]
+    networks: Tuple[str, ...]
+    current_date: Optional[str]
+    scraped_at: Optional[str]
+    digest: str
+
+
+EMPTY_SCHEDULE = ScheduleSnapshot(0, '', (), (), None, None, '')
+
+
+def snapshot_of(key: str, entry: CacheEntry) -> ScheduleSnapshot:
+    """A cache entry as a snapshot of its date, without publishing it"""
+    return ScheduleSnapshot(
+        version=entry.version,
+        key=key,
+        listings=tuple(entry.listings),
+        networks=tuple(entry.metadata.get('networks', ())),
+        current_date=entry.metadata.get('current_date'),
+        scraped_at=datetime.fromtimestamp(entry.scraped_at).isoformat(),
+        digest=entry.digest
+    )
+
+
+class SchedulePublisher:
+    """
+    The published ScheduleSnapshot of every cached date
+
+    Snapshots are published as the cache stores new content, never by the
+    requests reading them. Publishing builds the new snapshot, and a new
+    mapping of dates to snapshots, off to the side and swaps it in with a
+    single reference assignment, so readers call ``get`` without a lock and
+    always see whole snapshots. Only publishers are serialized, so a date
+    never goes back to an older version.
+    """
+
+    def __init__(self, max_dates: int = 32):
+        self.max_dates = max_dates
+        self._by_key: Dict[str, ScheduleSnapshot] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[ScheduleSnapshot]:
+        """The published snapshot of a date's cache key, if any"""
+        return self._by_key.get(key)
+
+    def publish(self, key: str, entry: CacheEntry) -> ScheduleSnapshot:
+        """
+        Publish a cache entry as its date's snapshot
+
+        An entry whose version is already published (or older than the
+        published one) keeps the current snapshot.
+
+        Returns:
+            The date's snapshot now published
+        """
+        with self._lock:
+            published = self._by_key.get(key)
+            if published is not None and published.version >= entry.version:
+                return published
+            snapshot = snapshot_of(key, entry)
+            by_key = dict(self._by_key)
+            by_key[key] = snapshot
+            # Forget the dates published longest ago
+            for old_key in sorted(by_key, key=lambda k: by_key[k].version)[:max(0, len(by_key) - self.max_dates)]:
+                del by_key[old_key]
+            self._by_key = by_key
+        return snapshot
@@ -1,27 +1,135 @@
 import requests
 from bs4 import BeautifulSoup
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from page_parser import (LXML_AVAILABLE, STREAM_CHUNK_SIZE, DrupalSettingsScanner, ListingsPageStream,
+                         parse_listings_page)
+from listing_schema import ListingNormalizer, listing_normalizer
+from metrics import count_upstream_request, span
+from rate_limit import RateLimitedError, RateLimiter, upstream_limiter
+from resilience import BudgetExceededError, CircuitOpenError, UpstreamPolicy, upstream_policy
+import contextvars
+import hashlib
 import json
 import logging
 import re
-from typing import List, Dict, Tuple, Optional
+import threading
+import time
+from typing import Iterator, List, Dict, Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
 
+class PageValidatorStore:
+    """
+    Cache validators and parsed results per page URL
+    
+    Holds each page's ETag, Last-Modified and body hash together with the
+    result parsed from it, so an unchanged page can be answered without
+    parsing it again. Shared by every scraper instance by default.
+    """
+    
+    def __init__(self, max_pages: int = 32):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'not_modified': 0,
+            'unchanged_body': 0,
+            'unchanged_streamed': 0,
+            'parsed': 0
+        }
+    
+    def get(self, url: str) -> Optional[Dict]:
+        """Stored validators and result for a URL, if any"""
+        with self._lock:
+            page = self._pages.get(url)
+            if page is not None:
+                self._pages.move_to_end(url)
+            return page
+    
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], body_hash: str,
+            listings: List[Dict[str, str]], metadata: Dict):
+        """Remember a page's validators and the result parsed from it"""
+        with self._lock:
+            self._pages[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'hash': body_hash,
+                'result': (listings, metadata),
+                'fetched_at': time.time()
+            }
+            self._pages.move_to_end(url)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+    
+    def count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+    
+    def stats(self) -> Dict:
+        """
+        Counters, including how many parses were avoided
+
+        An unchanged page that was streamed (``unchanged_streamed``) was
+        parsed while it downloaded, so it is not a parse avoided.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+            stats['pages'] = len(self._pages)
+        stats['parses_avoided'] = stats['not_modified'] + stats['unchanged_body']
+        return stats
+
+
+# Validators shared by every scraper in the process
+page_validators = PageValidatorStore()
+
+DEFAULT_BASE_URL = "https://adp.acb.org"
+
+
+def listings_url(date_string: str = None, base_url: str = DEFAULT_BASE_URL) -> str:
+    """URL of the listings page for a date string, or the default (today) page"""
+    url = f"{base_url}/tv-listings"
+    if date_string:
+        return f"{url}?date={requests.utils.quote(date_string)}"
+    return url
+
+
 class TVListingsScraper:
     """Scraper for Audio Description Project TV Listings"""
     
-    def __init__(self, base_url: str = "https://adp.acb.org"):
+    # Page parser engines: 'lxml' parses the page once with lxml's pull parser,
+    # 'soup' uses extract_table_data/extract_metadata (BeautifulSoup + regex)
+    PARSERS = ('lxml', 'soup')
+    
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1'
+    }
+    
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, parser: str = None,
+                 validators: Optional[PageValidatorStore] = page_validators,
+                 policy: UpstreamPolicy = upstream_policy, stream: bool = True,
+                 normalizer: ListingNormalizer = listing_normalizer, limiter: RateLimiter = upstream_limiter):
         self.base_url = base_url
+        self.validators = validators
+        self.policy = policy
+        self.limiter = limiter
+        self.normalizer = normalizer
+        if parser is None:
+            parser = 'lxml' if LXML_AVAILABLE else 'soup'
+        if parser not in self.PARSERS:
+            raise ValueError(f"Unknown parser {parser!r}, expected one of {self.PARSERS}")
+        self.parser = parser
+        # Parse pages while they download (lxml only)
+        self.stream = stream and parser == 'lxml'
         self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        })
+        self.session.headers.update(self.HEADERS)
     
     def extract_drupal_settings(self, html_content: str) -> Dict:
         """
@@ -91,6 +199,205 @@ class TVListingsScraper:
         
         return listings
     
+    def parse_page(self, html_content: str) -> Tuple[List[Dict[str, str]], Dict]:
+        """
+        Extract normalized listings and metadata from a page with the configured parser
+        
+        Args:
+            html_content: The HTML content of the page
+            
+        Returns:
+            Tuple of (listings, metadata)
+        """
+        if self.parser == 'lxml':
+            with span('lxml_parse'):
+                listings, metadata = parse_listings_page(html_content)
+        else:
+            with span('drupal_settings'):
+                metadata = self.extract_metadata(html_content)
+            with span('soup_parse'):
+                listings = self.extract_table_data(html_content)
+        with span('normalize'):
+            self.normalizer.normalize(listings)
+        return listings, metadata
+    
+    def _get(self, url: str, headers: Dict[str, str], stream: bool = False,
+             deadline: float = None) -> requests.Response:
+        """
+        GET a page within the upstream policy's latency budget
+        
+        Connection errors, timeouts and 5xx responses are retried with
+        jittered backoff while the budget lasts; every outcome is reported to
+        the circuit breaker. Each attempt first waits for a token from the
+        rate limiter.
+        
+        Raises:
+            RateLimitedError: If the rate limiter refuses to wait that long
+            CircuitOpenError: If the breaker refuses the call
+            BudgetExceededError: If the budget ran out before an attempt
+            requests.RequestException: If the last attempt failed
+        """
+        policy = self.policy
+        deadline = deadline or policy.deadline()
+        attempt = 0
+        while True:
+            self.limiter.wait_turn(url, deadline)
+            policy.breaker.before_call()
+            timeout = policy.attempt_timeout_for(deadline)
+            started = time.monotonic()
+            try:
+                with span('upstream_fetch'):
+                    response = self.session.get(url, timeout=timeout, headers=headers, stream=stream)
+            except requests.RequestException as e:
+                count_upstream_request('error')
+                policy.record_failure()
+                error = e
+            else:
+                count_upstream_request(response.status_code)
+                if response.status_code < 500:
+                    policy.record_success(time.monotonic() - started)
+                    return response
+                policy.record_failure()
+                response.close()
+                error = requests.HTTPError(f"{response.status_code} Server Error for url: {url}", response=response)
+            
+            attempt += 1
+            delay = policy.backoff(attempt, deadline)
+            if delay is None:
+                raise error
+            logger.warning(f"Retrying {url} in {delay:.2f}s after: {error}")
+            time.sleep(delay)
+    
+    def fetch_and_parse(self, url: str) -> Tuple[List[Dict[str, str]], Dict]:
+        """
+        Fetch one listings page and parse it
+        
+        When the page has been fetched before, the request is made conditional
+        on its ETag/Last-Modified. A 304, or a body with the same hash as last
+        time, returns the previously parsed result. In streaming mode every
+        page is hashed and parsed chunk by chunk as it arrives, so it is never
+        held in memory whole; the new result is dropped if the final hash
+        matches the last one. Otherwise the body is read, hashed and parsed
+        only if it changed.
+        
+        Args:
+            url: Full URL of the listings page
+            
+        Returns:
+            Tuple of (listings, metadata)
+            
+        Raises:
+            requests.RequestException, CircuitOpenError, BudgetExceededError or
+                RateLimitedError: If the page could not be fetched
+        """
+        logger.info(f"Fetching TV listings from {url}")
+        previous = self.validators.get(url) if self.validators else None
+        headers = {}
+        if previous:
+            if previous['etag']:
+                headers['If-None-Match'] = previous['etag']
+            if previous['last_modified']:
+                headers['If-Modified-Since'] = previous['last_modified']
+        
+        # One of the host's request slots is held until the body is read
+        deadline = self.policy.deadline()
+        with self.limiter.slot(url, deadline):
+            response = self._get(url, headers, stream=self.stream, deadline=deadline)
+            try:
+                if self.validators:
+                    self.validators.count('requests')
+                
+                if response.status_code == 304 and previous:
+                    logger.info(f"Not modified, reusing parsed result for {url}")
+                    self.validators.count('not_modified')
+                    return previous['result']
+                response.raise_for_status()
+                
+                if self.stream:
+                    listings, metadata, body_hash = self.parse_stream(response)
+                else:
+                    with span('body_hash'):
+                        body_hash = hashlib.sha1(response.content).hexdigest()
+            finally:
+                response.close()
+        
+        if previous and previous['hash'] == body_hash:
+            logger.info(f"Unchanged body, reusing parsed result for {url}")
+            # A streamed page was parsed anyway; keep the earlier result so it stays the same object
+            self.validators.count('unchanged_streamed' if self.stream else 'unchanged_body')
+            return previous['result']
+        
+        if not self.stream:
+            with span('decode'):
+                html_content = response.text
+            listings, metadata = self.parse_page(html_content)
+        logger.info(f"Extracted {len(listings)} TV listings for {metadata['current_date']}")
+        
+        if self.validators:
+            self.validators.count('parsed')
+            if listings:
+                self.validators.put(url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                    body_hash, listings, metadata)
+        
+        return listings, metadata
+    
+    def parse_stream(self, response: requests.Response) -> Tuple[List[Dict[str, str]], Dict, str]:
+        """
+        Parse a streamed response as its chunks arrive
+        
+        Args:
+            response: Response requested with ``stream=True``
+            
+        Returns:
+            Tuple of (listings, metadata, body hash)
+        """
+        # Same charset as response.text, without its full-body guessing
+        page = ListingsPageStream(encoding=response.encoding or 'utf-8')
+        with span('stream_parse'):
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                page.feed(chunk)
+        return self.finish_stream(page)
+    
+    def finish_stream(self, page: ListingsPageStream) -> Tuple[List[Dict[str, str]], Dict, str]:
+        """Close a streamed page and normalize its listings: (listings, metadata, body hash)"""
+        listings, metadata, body_hash = page.close()
+        with span('normalize'):
+            self.normalizer.normalize(listings)
+        return listings, metadata, body_hash
+    
+    def fetch_metadata(self, url: str) -> Dict:
+        """
+        Read only the drupalSettings metadata of a listings page
+        
+        The page is streamed through a DrupalSettingsScanner and the
+        connection is closed as soon as the settings have been read, so no
+        HTML is parsed and nothing after the settings is downloaded.
+        
+        Args:
+            url: Full URL of the listings page
+            
+        Returns:
+            Metadata dict (networks, dates, current_date)
+        """
+        logger.info(f"Fetching TV listings metadata from {url}")
+        deadline = self.policy.deadline()
+        with self.limiter.slot(url, deadline):
+            response = self._get(url, {}, stream=True, deadline=deadline)
+            try:
+                response.raise_for_status()
+                scanner = DrupalSettingsScanner()
+                with span('settings_scan'):
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        if scanner.feed(chunk):
+                            break
+            finally:
+                response.close()
+        return scanner.metadata()
+    
+    def date_url(self, date_string: str = None) -> str:
+        """URL of the listings page for a date string, or the default (today) page"""
+        return listings_url(date_string, self.base_url)
+    
     def scrape_daily_schedule(self) -> Tuple[List[Dict[str, str]], Dict]:
         """
         Scrape the daily TV schedule
@@ -100,45 +407,35 @@ class TVListingsScraper:
             - listings: List of TV listing dictionaries
             - metadata: Dictionary containing networks, dates, and current date
         """
-        url = f"{self.base_url}/tv-listings"
+        url = self.date_url()
         
         try:
-            logger.info(f"Fetching TV listings from {url}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            html_content = response.text
-            
-            # Extract drupalSettings
-            drupal_settings = self.extract_drupal_settings(html_content)
-            
-            # Extract metadata from drupalSettings
-            metadata = {
-                'networks': [],
-                'dates': [],
-                'current_date': 'Unknown Date'
-            }
+            return self.fetch_and_parse(url)
             
-            if 'tvListings' in drupal_settings:
-                tv_settings = drupal_settings['tvListings']
-                metadata['networks'] = tv_settings.get('networks', [])
-                metadata['dates'] = tv_settings.get('dates', [])
-                metadata['current_date'] = tv_settings.get('currentDate', 'Unknown Date')
-                logger.info(f"Found metadata - Networks: {len(metadata['networks'])}, Dates: {len(metadata['dates'])}")
-            
-            # Extract table data
-            listings = self.extract_table_data(html_content)
-            logger.info(f"Extracted {len(listings)} TV listings")
-            
-            return listings, metadata
-            
-        except requests.RequestException as e:
+        except (requests.RequestException, CircuitOpenError, BudgetExceededError, RateLimitedError) as e:
             logger.error(f"Error fetching data: {e}")
             return [], {}
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             return [], {}
     
+    def scrape_metadata(self) -> Dict:
+        """
+        Read the networks, dates and current date without the listings
+        
+        Returns:
+            Metadata dictionary, or an empty dict on failure
+        """
+        try:
+            return self.fetch_metadata(self.date_url())
+        
+        except (requests.RequestException, CircuitOpenError, BudgetExceededError, RateLimitedError) as e:
+            logger.error(f"Error fetching metadata: {e}")
+            return {}
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return {}
+    
     def scrape_by_date(self, date_string: str = None, date_index: int = None) -> Tuple[List[Dict[str, str]], Dict]:
         """
         Scrape TV listings for a specific date
@@ -159,8 +456,7 @@ class TVListingsScraper:
             url = f"{base_url}?date={requests.utils.quote(date_string)}"
         elif date_index is not None and date_index > 0:
             # First get the available dates
-            _, metadata = self.scrape_daily_schedule()
-            dates = metadata.get('dates', [])
+            dates = self.get_available_dates()
             if 0 <= date_index < len(dates):
                 date_string = dates[date_index]
                 url = f"{base_url}?date={requests.utils.quote(date_string)}"
@@ -171,73 +467,140 @@ class TVListingsScraper:
             url = base_url
         
         try:
-            logger.info(f"Fetching TV listings from {url}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
+            return self.fetch_and_parse(url)
             
-            html_content = response.text
-            
-            # Extract drupalSettings
-            drupal_settings = self.extract_drupal_settings(html_content)
-            
-            # Extract metadata from drupalSettings
-            metadata = {
-                'networks': [],
-                'dates': [],
-                'current_date': 'Unknown Date'
-            }
-            
-            if 'tvListings' in drupal_settings:
-                tv_settings = drupal_settings['tvListings']
-                metadata['networks'] = tv_settings.get('networks', [])
-                metadata['dates'] = tv_settings.get('dates', [])
-                metadata['current_date'] = tv_settings.get('currentDate', 'Unknown Date')
-                logger.info(f"Scraped data for: {metadata['current_date']}")
-            
-            # Extract table data
-            listings = self.extract_table_data(html_content)
-            logger.info(f"Extracted {len(listings)} TV listings")
-            
-            return listings, metadata
-            
-        except requests.RequestException as e:
+        except (requests.RequestException, CircuitOpenError, BudgetExceededError, RateLimitedError) as e:
             logger.error(f"Error fetching data: {e}")
             return [], {}
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             return [], {}
     
-    def scrape_all_dates(self) -> Dict[str, Tuple[List[Dict[str, str]], str]]:
+    def scrape_all_dates(self, max_workers: int = 4) -> Dict[str, Tuple[List[Dict[str, str]], str]]:
         """
         Scrape TV listings for all available dates
         
+        Args:
+            max_workers: Maximum number of dates fetched in parallel
+            
         Returns:
             Dictionary with date strings as keys and (listings, date) tuples as values
         """
-        all_data = {}
+        results, _, _ = self.scrape_all_dates_detailed(max_workers=max_workers)
+        return {
+            date_string: (listings, date_metadata.get('current_date', date_string))
+            for date_string, (listings, date_metadata) in results.items()
+        }
+    
+    def scrape_all_dates_detailed(self, max_workers: int = 4) -> Tuple[Dict[str, Tuple[List[Dict[str, str]], Dict]], Dict, Dict]:
+        """
+        Scrape TV listings for all available dates in parallel
+        
+        The default page is fetched first; its listings are used for today and
+        its metadata supplies the other dates, so a full refresh costs exactly
+        one upstream request per date.
+        
+        Args:
+            max_workers: Maximum number of dates fetched in parallel
+            
+        Returns:
+            Tuple of (results, metadata, report) where:
+            - results: Date string -> (listings, metadata) for dates with listings
+            - metadata: Metadata of the default page
+            - report: Per-date duration, listing count and error, plus totals
+        """
+        started = time.monotonic()
+        results = {}
+        report = {'dates': {}, 'requests': 0}
         
-        # First get available dates
-        _, metadata = self.scrape_daily_schedule()
+        def scrape_one(date_string):
+            date_started = time.monotonic()
+            try:
+                listings, date_metadata = self.fetch_and_parse(self.date_url(date_string))
+                error = None
+            except Exception as e:
+                listings, date_metadata, error = [], {}, str(e)
+            return listings, date_metadata, error, round(time.monotonic() - date_started, 3)
+        
+        # The default page gives today's listings and the date list
+        today_listings, metadata, error, duration = scrape_one(None)
+        report['requests'] += 1
         available_dates = metadata.get('dates', [])
         
         if not available_dates:
-            logger.warning("No dates found in metadata")
-            return all_data
+            logger.warning(f"No dates found in metadata{f': {error}' if error else ''}")
+            report['error'] = error or 'No dates found in metadata'
+            report['duration'] = round(time.monotonic() - started, 3)
+            return results, metadata, report
         
         logger.info(f"Scraping data for {len(available_dates)} dates: {available_dates}")
+        outcomes = {available_dates[0]: (today_listings, metadata, error, duration)}
+        
+        remaining = available_dates[1:]
+        if remaining:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                # Each task runs in a copy of this context so upstream requests
+                # are attributed to the client request that started them
+                futures = {
+                    executor.submit(contextvars.copy_context().run, scrape_one, date_string): date_string
+                    for date_string in remaining
+                }
+                for future in as_completed(futures):
+                    outcomes[futures[future]] = future.result()
+                    report['requests'] += 1
         
-        # Scrape each date
+        # Keep the site's date order
         for date_string in available_dates:
-            logger.info(f"Scraping {date_string}...")
-            listings, date_metadata = self.scrape_by_date(date_string=date_string)
-            
+            listings, date_metadata, error, duration = outcomes[date_string]
+            report['dates'][date_string] = {
+                'duration': duration,
+                'listings': len(listings),
+                'error': error
+            }
             if listings:
-                all_data[date_string] = (listings, date_metadata.get('current_date', date_string))
+                results[date_string] = (listings, date_metadata)
                 logger.info(f"✓ Scraped {len(listings)} listings for {date_string}")
             else:
                 logger.warning(f"✗ No listings found for {date_string}")
         
-        return all_data
+        report['duration'] = round(time.monotonic() - started, 3)
+        return results, metadata, report
+    
+    def iter_dates(self, max_workers: int = 4) -> Iterator[Tuple[str, List[Dict[str, str]], Dict]]:
+        """
+        Scrape every available date, yielding each one as soon as it is in order
+        
+        Like ``scrape_all_dates_detailed`` the default page supplies today and
+        the date list, but at most ``max_workers`` dates are fetched ahead of
+        the consumer, so only a few dates are held in memory at once.
+        
+        Yields:
+            Tuples of (date string, listings, metadata) in the site's date
+            order; listings are empty for a date that could not be scraped
+        """
+        listings, metadata = self.scrape_daily_schedule()
+        available_dates = metadata.get('dates', [])
+        if not available_dates:
+            logger.warning("No dates found in metadata")
+            return
+        yield available_dates[0], listings, metadata
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            pending = deque()
+            remaining = iter(available_dates[1:])
+            for date_string in remaining:
+                pending.append((date_string, executor.submit(
+                    contextvars.copy_context().run, self.scrape_by_date, date_string)))
+                if len(pending) >= max_workers:
+                    break
+            while pending:
+                date_string, future = pending.popleft()
+                for next_date in remaining:
+                    pending.append((next_date, executor.submit(
+                        contextvars.copy_context().run, self.scrape_by_date, next_date)))
+                    break
+                listings, date_metadata = future.result()
+                yield date_string, listings, date_metadata
     
     def extract_metadata(self, html_content: str) -> Dict:
         """Extract metadata from HTML content"""
@@ -264,8 +627,7 @@ class TVListingsScraper:
         Returns:
             List of available date strings
         """
-        _, metadata = self.scrape_daily_schedule()
-        return metadata.get('dates', [])
+        return self.scrape_metadata().get('dates', [])
     
     def get_available_networks(self) -> List[str]:
         """
@@ -274,5 +636,4 @@ class TVListingsScraper:
         Returns:
             List of available network names
         """
-        _, metadata = self.scrape_daily_schedule()
-        return metadata.get('networks', [])
\ No newline at end of file
+        return self.scrape_metadata().get('networks', [])
\ No newline at end of file
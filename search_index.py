@@ -0,0 +1,306 @@
+import datetime
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from listing_schema import split_program
+from listing_store import DateBlock, ListingStore
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Query words dropped unless the query has nothing else
+STOPWORDS = frozenset(('a', 'an', 'and', 'at', 'in', 'of', 'on', 'the', 'to'))
+
+# Per query word: an exact word, a word it begins, a misspelling of a word
+EXACT_WEIGHT = 3.0
+PREFIX_WEIGHT = 2.0
+FUZZY_WEIGHTS = {1: 1.5, 2: 1.0}
+
+# Matches in the network name count for less than matches in the title
+NETWORK_WEIGHT = 0.5
+
+# Added when the query covers the whole title
+WHOLE_TITLE_BONUS = 2.0
+
+# Shortest query word matched as a prefix or with typos
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 4
+
+# Words of at least this length may have two typos instead of one
+TWO_EDIT_LENGTH = 8
+
+# Most vocabulary words a prefix expands to
+MAX_PREFIX_EXPANSION = 200
+
+TITLE, NETWORK = 0, 1
+
+NO_MATCH = (0.0, 0)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of a title or query, with accents and apostrophes dropped"""
+    text = unicodedata.normalize('NFKD', text.replace('&', ' and '))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return WORD_PATTERN.findall(text.lower().replace("'", '').replace('’', ''))
+
+
+def query_words(query: str) -> List[str]:
+    """Distinct words of a search query, stopwords dropped unless that leaves none"""
+    words = list(dict.fromkeys(tokenize(query)))
+    kept = [word for word in words if word not in STOPWORDS]
+    return kept or words
+
+
+def deletions(word: str) -> Set[str]:
+    """Every string one character shorter than ``word``"""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Edit distance with adjacent transpositions, capped at ``limit + 1``
+
+    Returns:
+        The distance, or ``limit + 1`` if it is larger than ``limit``
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SearchHit(NamedTuple):
+    score: float
+    date: str
+    block: DateBlock
+    row: int
+
+
+class DatePostings:
+    """What the index holds for one date: the block searched and the words it added"""
+
+    __slots__ = ('block', 'words', 'title_lengths')
+
+    def __init__(self, block: DateBlock):
+        self.block = block
+        self.words: Set[str] = set()
+        self.title_lengths = bytearray()
+
+
+class SearchIndex:
+    """
+    Inverted index over the program titles and networks in a ListingStore
+
+    Each word maps to the rows, per date, whose title or network contains
+    it. The index follows the store as a listener, so a date is (re)indexed
+    when it is stored and forgotten when it is dropped; hits point into the
+    very block that was indexed, so rows always match.
+
+    A query word matches a word in the vocabulary exactly, as a prefix
+    ("jeop" finds "jeopardy") or, for longer words, within one or two typos
+    (found through a map of each word's single-character deletions). Every
+    query word has to match; a row's score adds up the best match of each.
+    """
+
+    def __init__(self, store: ListingStore):
+        self.store = store
+        self._dates: Dict[str, DatePostings] = {}
+        # Word -> date -> row << 1 | TITLE or NETWORK
+        self._postings: Dict[str, Dict[str, array]] = {}
+        self._vocabulary: List[str] = []
+        self._deletions: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.searches = 0
+        store.add_listener(self.update)
+        for date in store.dates():
+            self.update(date, store.block(date))
+
+    def update(self, date: str, block: Optional[DateBlock]):
+        """Index a date's block, or forget the date when ``block`` is None"""
+        # A later add or remove of the same date has its own notification
+        if self.store.block(date) is not block:
+            return
+        postings = None
+        if block is not None:
+            postings = DatePostings(block)
+            rows: Dict[str, array] = {}
+            network_words = {}
+            for row, program in enumerate(block.programs):
+                title = split_program(program)[0]
+                postings.title_lengths.append(min(len(query_words(title)), 255))
+                for word in set(tokenize(title)):
+                    rows.setdefault(word, array('I')).append(row << 1 | TITLE)
+                network = block.networks[row]
+                if network not in network_words:
+                    network_words[network] = set(tokenize(self.store.network_name(network)))
+                for word in network_words[network]:
+                    rows.setdefault(word, array('I')).append(row << 1 | NETWORK)
+            postings.words = set(rows)
+
+        with self._lock:
+            old = self._dates.pop(date, None)
+            if old is not None:
+                for word in old.words:
+                    by_date = self._postings[word]
+                    by_date.pop(date, None)
+                    if not by_date:
+                        self._forget_word(word)
+            if postings is not None:
+                self._dates[date] = postings
+                for word, codes in rows.items():
+                    by_date = self._postings.get(word)
+                    if by_date is None:
+                        by_date = self._postings[word] = {}
+                        self._learn_word(word)
+                    by_date[date] = codes
+
+    def _learn_word(self, word: str):
+        insort(self._vocabulary, word)
+        if len(word) >= MIN_FUZZY_LENGTH:
+            for variant in deletions(word):
+                self._deletions.setdefault(variant, set()).add(word)
+
+    def _forget_word(self, word: str):
+        del self._postings[word]
+        del self._vocabulary[bisect_left(self._vocabulary, word)]
+        if len(word) >= MIN_FUZZY_LENGTH:
+            for variant in deletions(word):
+                words = self._deletions.get(variant)
+                if words is not None:
+                    words.discard(word)
+                    if not words:
+                        del self._deletions[variant]
+
+    def _expand(self, word: str) -> Dict[str, float]:
+        """Vocabulary words a query word matches, with the weight of each match"""
+        matches: Dict[str, float] = {}
+        if len(word) >= MIN_FUZZY_LENGTH:
+            limit = 2 if len(word) >= TWO_EDIT_LENGTH else 1
+            candidates = set(self._deletions.get(word, ()))
+            for variant in deletions(word):
+                if variant in self._postings:
+                    candidates.add(variant)
+                candidates.update(self._deletions.get(variant, ()))
+            for candidate in candidates:
+                distance = edit_distance(word, candidate, limit)
+                if 0 < distance <= limit:
+                    matches[candidate] = FUZZY_WEIGHTS[distance]
+        if len(word) >= MIN_PREFIX_LENGTH:
+            position = bisect_left(self._vocabulary, word)
+            for candidate in self._vocabulary[position:position + MAX_PREFIX_EXPANSION]:
+                if not candidate.startswith(word):
+                    break
+                matches[candidate] = PREFIX_WEIGHT
+        if word in self._postings:
+            matches[word] = EXACT_WEIGHT
+        return matches
+
+    def search(self, query: str, dates: Optional[Iterable[str]] = None, network_ids: Optional[List[int]] = None,
+               start: Optional[int] = None, end: Optional[int] = None, movie: Optional[bool] = None,
+               today: Optional[datetime.date] = None) -> List[SearchHit]:
+        """
+        Rows matching every word of a query, best first
+
+        Args:
+            query: Words to find in titles or network names
+            dates: Only these stored dates (default all)
+            network_ids: Only rows on one of these store network ids
+            start: Only rows starting at or after this minute
+            end: Only rows starting before this minute (a window with
+                end <= start wraps past midnight)
+            movie: Only movies (True) or only non-movies (False)
+            today: Among equal scores, airings from this day on come first
+                (soonest first), then earlier ones (latest first)
+
+        Returns:
+            Every matching row as a SearchHit
+        """
+        words = query_words(query)
+        if not words:
+            return []
+        wanted = set(dates) if dates is not None else None
+        networks = set(network_ids) if network_ids is not None else None
+        timed = start is not None or end is not None
+        low = 0 if start is None else start
+        high = 24 * 60 if end is None else end
+
+        with self._lock:
+            self.searches += 1
+            scoped = [date for date in self._dates if wanted is None or date in wanted]
+            # Rarest words first, so the candidate rows shrink fastest
+            expansions = sorted((self._expand(word) for word in words),
+                                key=lambda matches: sum(len(self._postings[w]) for w in matches))
+            hits = []
+            for date in scoped:
+                postings = self._dates[date]
+                block = postings.block
+                # Row -> [score, words matched in the title]
+                scores: Optional[Dict[int, List]] = None
+                for matches in expansions:
+                    best: Dict[int, Tuple[float, int]] = {}
+                    for candidate, weight in matches.items():
+                        codes = self._postings[candidate].get(date)
+                        if codes is None:
+                            continue
+                        in_title, in_network = (weight, 1), (weight * NETWORK_WEIGHT, 0)
+                        for code in codes:
+                            row = code >> 1
+                            if scores is not None and row not in scores:
+                                continue
+                            match = in_network if code & 1 else in_title
+                            if best.get(row, NO_MATCH) < match:
+                                best[row] = match
+                    if scores is None:
+                        scores = {row: list(match) for row, match in best.items()}
+                    else:
+                        scores = {row: [score + best[row][0], titled + best[row][1]]
+                                  for row, (score, titled) in scores.items() if row in best}
+                    if not scores:
+                        break
+
+                for row, (score, titled) in scores.items():
+                    if networks is not None and block.networks[row] not in networks:
+                        continue
+                    if movie is not None and block.movies[row] != (1 if movie else 0):
+                        continue
+                    if timed:
+                        minutes = block.times[row]
+                        if minutes < 0 or not (low <= minutes < high if high > low else minutes >= low or minutes < high):
+                            continue
+                    if titled == len(words) >= postings.title_lengths[row]:
+                        score += WHOLE_TITLE_BONUS
+                    hits.append(SearchHit(score, date, block, row))
+
+        def rank(hit: SearchHit):
+            day = hit.block.day
+            minutes = hit.block.times[hit.row]
+            if today is None or day is None or day >= today:
+                return -hit.score, 0, (day or datetime.date.max).toordinal(), minutes
+            return -hit.score, 1, -day.toordinal(), minutes
+
+        hits.sort(key=rank)
+        return hits
+
+    def stats(self) -> Dict:
+        """Size of the index for the status endpoint"""
+        with self._lock:
+            return {
+                'dates': len(self._dates),
+                'words': len(self._vocabulary),
+                'postings': sum(len(codes) for by_date in self._postings.values() for codes in by_date.values()),
+                'searches': self.searches
+            }
@@ -0,0 +1,281 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from cache import ListingsCache
+from prefetch import PrefetchScheduler
+from snapshot_store import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+LEASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+class LeaderLease:
+    """
+    Time-limited lease in a SQLite file, held by at most one process
+
+    The holder renews it by calling ``acquire`` again before ``ttl`` seconds
+    pass; if it stops (crash, shutdown) another process takes the lease over
+    once it has expired.
+    """
+
+    def __init__(self, path: str, name: str = 'scraper', ttl: float = 30):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.expires_at = 0.0
+        with self._connect() as connection:
+            connection.execute(LEASE_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed"""
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @property
+    def holder(self) -> str:
+        # Worked out on use, since gunicorn may fork workers after import
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def acquire(self) -> bool:
+        """Take or renew the lease; returns True if this process holds it"""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET '
+                'holder = excluded.holder, expires_at = excluded.expires_at '
+                'WHERE leases.holder = excluded.holder OR leases.expires_at < ?',
+                (self.name, self.holder, now + self.ttl, now)
+            )
+            holder, expires_at = connection.execute(
+                'SELECT holder, expires_at FROM leases WHERE name = ?', (self.name,)
+            ).fetchone()
+        self.expires_at = expires_at if holder == self.holder else 0.0
+        return holder == self.holder
+
+    def release(self):
+        """Give up the lease if this process holds it"""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (self.name, self.holder))
+        self.expires_at = 0.0
+
+    def current(self) -> Optional[Dict]:
+        """Current holder and expiry, or None if nobody holds the lease"""
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT holder, expires_at FROM leases WHERE name = ? AND expires_at >= ?',
+                (self.name, time.time())
+            ).fetchone()
+        if not row:
+            return None
+        return {'holder': row[0], 'expires_at': datetime.fromtimestamp(row[1], timezone.utc).isoformat()}
+
+
+class SharedLoads:
+    """
+    Cache misses shared between workers through a SnapshotStore file
+
+    Used as ``ListingsCache.shared``. On a miss a worker takes a short lease
+    on the date (``load:<date>`` in the lease table) before scraping it, so
+    only one worker fetches a date at a time. A worker that finds the lease
+    held waits for the holder's snapshot, polling the store, and scrapes
+    itself only if none turns up within ``wait`` seconds or the lease is
+    released without one.
+    """
+
+    def __init__(self, store: SnapshotStore, path: str, wait: float = 5, poll_interval: float = 0.2,
+                 lease_ttl: float = 60):
+        self.store = store
+        self.path = path
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.lease_ttl = lease_ttl
+        self.claims = 0
+        self.waits = 0
+        self.wait_timeouts = 0
+
+    def _wait_for(self, key: str, max_age: float, lease: LeaderLease) -> Tuple[Optional[tuple], bool]:
+        """(result another worker stored, whether this worker now holds the date's lease)"""
+        deadline = time.monotonic() + self.wait
+        waited = False
+        while True:
+            result = self.store.fresh(key, max_age)
+            if result:
+                return result, False
+            if lease.acquire():
+                return None, True
+            if not waited:
+                waited = True
+                self.waits += 1
+            if time.monotonic() >= deadline:
+                self.wait_timeouts += 1
+                logger.warning(f"No snapshot of {key} from {lease.current() or 'another worker'} "
+                               f"within {self.wait}s; scraping it here")
+                return None, False
+            time.sleep(self.poll_interval)
+
+    @contextmanager
+    def claim(self, key: str, max_age: float):
+        """
+        Find a date's result from another worker, or the right to load it
+
+        Yields:
+            (listings, metadata) scraped by another worker within ``max_age``
+            seconds, or None if the caller should load the date itself
+        """
+        lease = None
+        try:
+            lease = LeaderLease(self.path, name=f'load:{key}', ttl=self.lease_ttl)
+            result, claimed = self._wait_for(key, max_age, lease)
+        except Exception as e:
+            logger.error(f"Shared cache lookup failed for {key}: {e}")
+            result, claimed = None, False
+        if not claimed:
+            yield result
+            return
+        self.claims += 1
+        try:
+            yield None
+        finally:
+            try:
+                lease.release()
+            except Exception as e:
+                logger.error(f"Could not release the load lease for {key}: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'wait': self.wait,
+            'claims': self.claims,
+            'waits': self.waits,
+            'wait_timeouts': self.wait_timeouts
+        }
+
+
+class SharedCacheCoordinator:
+    """
+    Lets several web workers share one scraper through a SnapshotStore file
+
+    Every ``poll_interval`` seconds each worker tries to take the leader
+    lease. The leader runs the prefetch scheduler, whose results reach the
+    store through the cache listeners. The other workers stop any scheduler
+    of their own and copy new snapshots from the store into their local
+    cache, so only one process talks to the upstream site. Without a
+    prefetcher the lease is still held, but only requests load dates.
+    """
+
+    def __init__(self, cache: ListingsCache, store: SnapshotStore, prefetcher: Optional[PrefetchScheduler],
+                 lease: LeaderLease, poll_interval: float = 5):
+        self.cache = cache
+        self.store = store
+        self.prefetcher = prefetcher
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.syncs = 0
+        self.synced = 0
+        self.leadership_changes = 0
+
+    def start(self):
+        """Start the coordination thread if it is not already running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='shared-cache', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop coordinating, stop the scheduler and hand the lease on"""
+        self._stop.set()
+        if self.prefetcher:
+            self.prefetcher.stop()
+        if self.is_leader:
+            try:
+                self.lease.release()
+            except Exception as e:
+                logger.error(f"Could not release the leader lease: {e}")
+            self.is_leader = False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Shared cache coordination failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def tick(self):
+        """Renew or contest the lease, then act as leader or follower"""
+        leader = self.lease.acquire()
+        if leader != self.is_leader:
+            self.leadership_changes += 1
+            logger.info(f"Worker {self.lease.holder} is now the scraping "
+                        f"{'leader' if leader else 'follower'}")
+        self.is_leader = leader
+
+        if leader:
+            if self.prefetcher and not self.prefetcher.running:
+                self.prefetcher.start()
+        else:
+            if self.prefetcher and self.prefetcher.running:
+                self.prefetcher.stop()
+            self.sync()
+
+    def sync(self) -> int:
+        """
+        Copy snapshots stored by other workers into the local cache
+
+        Only snapshots scraped within the cache TTL are used; dates whose
+        content already matches are just marked fresh.
+
+        Returns:
+            Number of dates whose listings were replaced
+        """
+        synced = 0
+        for header in self.store.headers(max_age=self.cache.ttl):
+            key = header['date_key']
+            entry = self.cache.peek_entry(key)
+            if entry is not None and entry.digest == header['content_hash']:
+                self.cache.touch(key, notify=False)
+                continue
+            result = self.store.fresh(key, self.cache.ttl)
+            if result:
+                self.cache.put(key, *result, scraped_at=header['scraped_at_epoch'])
+                synced += 1
+        self.syncs += 1
+        self.synced += synced
+        return synced
+
+    def stats(self) -> Dict:
+        """Role and lease details for the status endpoint"""
+        return {
+            'worker': self.lease.holder,
+            'role': 'leader' if self.is_leader else 'follower',
+            'leader': self.lease.current(),
+            'lease_ttl': self.lease.ttl,
+            'poll_interval': self.poll_interval,
+            'syncs': self.syncs,
+            'synced_dates': self.synced,
+            'leadership_changes': self.leadership_changes
+        }
@@ -0,0 +1,223 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from cache import content_hash
+from listing_schema import listing_normalizer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    date_key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    scraped_at REAL NOT NULL,
+    current_date TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    listings TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    PRIMARY KEY (date_key, version)
+)
+"""
+
+
+class SnapshotStore:
+    """
+    SQLite store of parsed per-date snapshots
+
+    Every stored result gets the next version number for its date key and the
+    time it was scraped. Saving a result identical to the latest snapshot is a
+    no-op. Compaction keeps the last ``keep_versions`` versions of each date
+    and drops anything scraped more than ``retain_days`` ago.
+
+    Several processes may share one file (one per web worker), so nothing
+    about the latest versions is cached in memory and version numbers are
+    allocated inside the INSERT.
+    """
+
+    def __init__(self, path: str, retain_days: float = 28, keep_versions: int = 5,
+                 compact_every: int = 50):
+        self.path = path
+        self.retain_days = retain_days
+        self.keep_versions = keep_versions
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._saves_since_compact = 0
+        self.saves = 0
+        self.skipped = 0
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed"""
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _row_to_snapshot(row) -> Dict:
+        date_key, version, scraped_at, current_date, digest, listings, metadata = row
+        return {
+            'date_key': date_key,
+            'version': version,
+            'scraped_at': datetime.fromtimestamp(scraped_at, timezone.utc).isoformat(),
+            'scraped_at_epoch': scraped_at,
+            'current_date': current_date,
+            'content_hash': digest,
+            # Snapshots saved before the listing schema gain its fields
+            'listings': listing_normalizer.normalize(json.loads(listings)),
+            'metadata': json.loads(metadata)
+        }
+
+    @staticmethod
+    def _latest_header(connection: sqlite3.Connection, date_key: str) -> Optional[Dict]:
+        row = connection.execute(
+            'SELECT version, content_hash FROM snapshots WHERE date_key = ? '
+            'ORDER BY version DESC LIMIT 1', (date_key,)
+        ).fetchone()
+        return {'version': row[0], 'content_hash': row[1]} if row else None
+
+    def save(self, date_key: str, listings: List[Dict[str, str]], metadata: Dict) -> int:
+        """
+        Store a parsed result as the next version for its date
+
+        Args:
+            date_key: Cache key of the date
+            listings: Parsed listings
+            metadata: Parsed metadata
+
+        Returns:
+            Version of the latest snapshot for the date after saving
+        """
+        digest = content_hash(listings, metadata)
+        with self._lock, self._connect() as connection:
+            latest = self._latest_header(connection, date_key)
+            if latest and latest['content_hash'] == digest:
+                self.skipped += 1
+                return latest['version']
+
+            # Another process may have saved a version since the check above
+            connection.execute(
+                'INSERT INTO snapshots SELECT ?, COALESCE(MAX(version), 0) + 1, ?, ?, ?, ?, ? '
+                'FROM snapshots WHERE date_key = ?',
+                (date_key, time.time(), metadata.get('current_date', date_key), digest,
+                 json.dumps(listings, separators=(',', ':')), json.dumps(metadata, separators=(',', ':')),
+                 date_key)
+            )
+            version = self._latest_header(connection, date_key)['version']
+            self.saves += 1
+            self._saves_since_compact += 1
+            compact = self._saves_since_compact >= self.compact_every
+
+        if compact:
+            self.compact()
+        return version
+
+    def latest(self, date_key: str) -> Optional[Dict]:
+        """The newest snapshot for a date, or None"""
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT * FROM snapshots WHERE date_key = ? ORDER BY version DESC LIMIT 1', (date_key,)
+            ).fetchone()
+        return self._row_to_snapshot(row) if row else None
+
+    def fresh(self, date_key: str, max_age: float) -> Optional[Tuple[List[Dict[str, str]], Dict]]:
+        """(listings, metadata) of a date's newest snapshot if scraped within ``max_age`` seconds"""
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT listings, metadata FROM snapshots WHERE date_key = ? AND scraped_at >= ? '
+                'ORDER BY version DESC LIMIT 1', (date_key, time.time() - max_age)
+            ).fetchone()
+        return (listing_normalizer.normalize(json.loads(row[0])), json.loads(row[1])) if row else None
+
+    def touch(self, date_key: str) -> bool:
+        """Mark a date's newest snapshot as scraped now (the page was unchanged)"""
+        with self._connect() as connection:
+            return connection.execute(
+                'UPDATE snapshots SET scraped_at = ? WHERE date_key = ? AND version = ('
+                '  SELECT MAX(version) FROM snapshots WHERE date_key = ?'
+                ')', (time.time(), date_key, date_key)
+            ).rowcount > 0
+
+    def headers(self, max_age: float = None) -> List[Dict]:
+        """
+        Version, date header, content hash and scrape time of every date's newest snapshot
+
+        Cheap enough to poll, since the listings themselves are not read.
+
+        Args:
+            max_age: Only snapshots scraped within this many seconds
+        """
+        since = time.time() - max_age if max_age is not None else 0
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT date_key, MAX(version), current_date, content_hash, scraped_at FROM snapshots '
+                'GROUP BY date_key HAVING scraped_at >= ?', (since,)
+            ).fetchall()
+        return [
+            {'date_key': date_key, 'version': version, 'current_date': current_date, 'content_hash': digest,
+             'scraped_at_epoch': scraped_at}
+            for date_key, version, current_date, digest, scraped_at in rows
+        ]
+
+    def latest_all(self, max_age: float = None) -> List[Dict]:
+        """
+        The newest snapshot of every date, oldest scrape first
+
+        Args:
+            max_age: Only snapshots scraped within this many seconds
+        """
+        since = time.time() - max_age if max_age is not None else 0
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT s.* FROM snapshots s JOIN ('
+                '  SELECT date_key, MAX(version) AS version FROM snapshots GROUP BY date_key'
+                ') latest ON s.date_key = latest.date_key AND s.version = latest.version '
+                'WHERE s.scraped_at >= ? ORDER BY s.scraped_at', (since,)
+            ).fetchall()
+        return [self._row_to_snapshot(row) for row in rows]
+
+    def compact(self) -> int:
+        """
+        Drop superseded versions and snapshots older than the retention window
+
+        Returns:
+            Number of snapshots deleted
+        """
+        cutoff = time.time() - self.retain_days * 86400
+        with self._lock, self._connect() as connection:
+            deleted = connection.execute('DELETE FROM snapshots WHERE scraped_at < ?', (cutoff,)).rowcount
+            deleted += connection.execute(
+                'DELETE FROM snapshots WHERE version <= ('
+                '  SELECT MAX(version) FROM snapshots latest WHERE latest.date_key = snapshots.date_key'
+                ') - ?', (self.keep_versions,)
+            ).rowcount
+            self._saves_since_compact = 0
+        if deleted:
+            logger.info(f"Compacted {deleted} old snapshots")
+        return deleted
+
+    def stats(self) -> Dict:
+        """Size and counters for the status endpoint"""
+        with self._connect() as connection:
+            snapshots, dates = connection.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT date_key) FROM snapshots'
+            ).fetchone()
+        return {
+            'path': self.path,
+            'snapshots': snapshots,
+            'dates': dates,
+            'saves': self.saves,
+            'unchanged_skipped': self.skipped,
+            'retain_days': self.retain_days
+        }
@@ -2,6 +2,7 @@
 let allListings = [];
 let filteredListings = [];
 let availableDates = [];
+let availableNetworks = [];
 let recognition = null;
 let globalRecognition = null; // For global wake word detection
 let isListening = false;
@@ -388,9 +389,14 @@ function timeTo24Hour(timeStr) {
     return hour;
 }
 
+// Hour a listing starts: the server's normalized minutes, or parsed from its time string
+function listingHour(listing) {
+    return typeof listing.minutes === 'number' ? Math.floor(listing.minutes / 60) : timeTo24Hour(listing.time);
+}
+
 // Helper function to check if a listing is in a specific time period
 function isListingInTimePeriod(listing, timePeriod) {
-    const hour = timeTo24Hour(listing.time);
+    const hour = listingHour(listing);
     
     switch(timePeriod) {
         case 'morning':
@@ -585,17 +591,17 @@ function readListingsByTimeRange(command) {
     
     // Filter listings by time range
     const rangeFilteredListings = listingsToRead.filter(listing => {
-        const listingHour = timeTo24Hour(listing.time);
+        const hour = listingHour(listing);
         const startHour = startTimeParsed.hour;
         const endHour = endTimeParsed.hour;
         
-        console.log('Comparing:', { listing: listing.time, listingHour, startHour, endHour });
+        console.log('Comparing:', { listing: listing.time, listingHour: hour, startHour, endHour });
         
         // Handle overnight ranges
         if (endHour < startHour) {
-            return listingHour >= startHour || listingHour < endHour;
+            return hour >= startHour || hour < endHour;
         } else {
-            return listingHour >= startHour && listingHour < endHour;
+            return hour >= startHour && hour < endHour;
         }
     });
     
@@ -1309,6 +1315,19 @@ function processVoiceCommand(transcript) {
         }, 500);
     }
     
+    // "What's on now / next on <network>" - answered by the server without the day's listings
+    else if (command.includes('on now') || command.includes('playing now') || command.includes('airing now')) {
+        readOnAir(false, command);
+    }
+    else if (command.includes('on next') || command.includes("what's next") || command.includes('coming up')) {
+        readOnAir(true, command);
+    }
+    
+    // "Find Jeopardy", "search for Star Trek movies on TCM" - searched on the server across every retained date
+    else if (command.startsWith('find ') || command.startsWith('search for ') || command.startsWith('when is ')) {
+        readSearch(command);
+    }
+    
     // Read listings commands
     else if (command.includes('read all listing') || command.includes('read all listings') || command.includes('read everything')) {
         console.log('Read all listings command detected:', command);
@@ -1427,12 +1446,72 @@ function showVoiceFeedback(message, type = 'success') {
     }, 3000);
 }
 
+// Read what is on now (or next), for the networks named in the command or all of them
+function readOnAir(upcoming, command) {
+    const networks = availableNetworks.filter(network => command.includes(network.toLowerCase()));
+    const params = networks.length > 0 ? `?network=${encodeURIComponent(networks.join(','))}` : '';
+    
+    fetch(`/${upcoming ? 'next' : 'now'}${params}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success || data.listings.length === 0) {
+                showVoiceFeedback(data.error || 'Nothing found for that network.', 'error');
+                return;
+            }
+            speakSpecificListings(data.listings, true, upcoming ? 'Up next' : `On now at ${data.time}`);
+        })
+        .catch(error => {
+            console.error('Error fetching on-air listings:', error);
+            showVoiceFeedback('Could not get what is on. Please try again.', 'error');
+        });
+}
+
+// Read the best matches for a "find ..." command
+function readSearch(command) {
+    let query = command.replace(/^(find|search for|when is)\s+/, '');
+    const params = new URLSearchParams({limit: '10'});
+    
+    // "... on TCM" scopes the search to that network
+    const onNetwork = query.match(/\s+on\s+(.+)$/);
+    const network = onNetwork && availableNetworks.find(name => name.toLowerCase() === onNetwork[1].trim());
+    if (network) {
+        params.set('network', network);
+        query = query.slice(0, onNetwork.index);
+    }
+    if (/\bmovies?\b/.test(query)) {
+        params.set('movie', 'true');
+        query = query.replace(/\bmovies?\b/g, ' ');
+    }
+    query = query.replace(/\b(any|some|shows?|on|playing|airing)\b/g, ' ').replace(/\s+/g, ' ').trim();
+    if (!query) {
+        showVoiceFeedback('Try "Find Jeopardy" or "Find Star Trek movies"', 'error');
+        return;
+    }
+    params.set('q', query);
+    
+    fetch(`/search?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success || data.listings.length === 0) {
+                showVoiceFeedback(data.error || `Nothing found for ${query}.`, 'error');
+                return;
+            }
+            // Matches can be on any retained date, so say which
+            const listings = data.listings.map(listing => ({...listing, time: `${listing.time} on ${listing.date}`}));
+            speakSpecificListings(listings, true, `${data.total} results for ${query}`);
+        })
+        .catch(error => {
+            console.error('Error searching listings:', error);
+            showVoiceFeedback('Could not search the listings. Please try again.', 'error');
+        });
+}
+
 // Initialize date selector with dates from the website
 function initializeDateSelector() {
     const dateSelector = document.getElementById('dateSelector');
     
-    // First, fetch the available dates from the website
-    fetch('/scrape?date=0')
+    // First, fetch the available dates from the website (no listings needed)
+    fetch('/dates')
         .then(response => response.json())
         .then(data => {
             if (data.success && data.dates && data.dates.length > 0) {
@@ -1447,6 +1526,7 @@ function initializeDateSelector() {
                 
                 // Store available dates globally
                 availableDates = data.dates;
+                availableNetworks = data.networks || [];
             }
         })
         .catch(error => {
@@ -1669,25 +1749,8 @@ function filterListings() {
         }
         
         // Time filter
-        if (timeFilter) {
-            const hour = parseInt(listing.time.split(':')[0]);
-            const isPM = listing.time.includes('PM');
-            let hour24 = isPM && hour !== 12 ? hour + 12 : (!isPM && hour === 12 ? 0 : hour);
-            
-            switch(timeFilter) {
-                case 'morning':
-                    if (hour24 < 6 || hour24 >= 12) return false;
-                    break;
-                case 'afternoon':
-                    if (hour24 < 12 || hour24 >= 18) return false;
-                    break;
-                case 'prime':
-                    if (hour24 < 18 || hour24 >= 23) return false;
-                    break;
-                case 'late':
-                    if (hour24 >= 6 && hour24 < 23) return false;
-                    break;
-            }
+        if (timeFilter && !isListingInTimePeriod(listing, timeFilter)) {
+            return false;
         }
         
         // Type filter